@@ -0,0 +1,79 @@
+"""Benchmark dell'inferenza batch: confronta batch_infer con il pool di processi al variare dei worker.
+
+Uso: python benchmark.py [--samples N] [--inputs K] [--terms T] [--chunk-size R] [--workers 1 2 4 ...]
+"""
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+
+from flaskr.fis_model import FISModel, batch_infer
+from flaskr.parallel import parallel_batch_infer, PARALLEL_CHUNK_ROWS
+
+
+def synthetic_fis(n_inputs, n_terms, seed=0):
+    """FIS sintetico: n_inputs variabili con n_terms termini triangolari/gaussiani e tutte le combinazioni come regole."""
+    rng = np.random.default_rng(seed)
+    data = {"input": {}, "output": {}}
+
+    centers = np.linspace(0, 100, n_terms)
+    width = 100 / max(n_terms - 1, 1)
+    for i in range(n_inputs):
+        terms = []
+        for j, center in enumerate(centers):
+            if j % 2:
+                terms.append({"term_name": f"t{j}", "function_type": "Gaussian",
+                              "params": {"mean": float(center), "sigma": float(width / 2)}})
+            else:
+                terms.append({"term_name": f"t{j}", "function_type": "Triangolare",
+                              "params": {"a": float(center - width), "b": float(center), "c": float(center + width)}})
+        data["input"][f"x{i}"] = {"domain": [0, 100], "terms": terms}
+
+    data["output"]["y"] = {"domain": [0, 100], "terms": [
+        {"term_name": f"o{j}", "function_type": "Triangolare", "defuzzy_type": "centroid",
+         "params": {"a": float(center - width), "b": float(center), "c": float(center + width)}}
+        for j, center in enumerate(centers)
+    ]}
+
+    for k, combo in enumerate(itertools.product(range(n_terms), repeat=n_inputs)):
+        data[f"Rule{k}"] = {
+            "inputs": [{"input_variable": f"x{i}", "input_term": f"t{j}"} for i, j in enumerate(combo)],
+            "output_variable": "y",
+            "output_term": f"o{int(rng.integers(n_terms))}"
+        }
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--inputs", type=int, default=3)
+    parser.add_argument("--terms", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=PARALLEL_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, nargs="+")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, *[2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores], cores})
+
+    model = FISModel(synthetic_fis(args.inputs, args.terms))
+    X = np.random.default_rng(1).uniform(0, 100, size=(args.samples, args.inputs))
+    print(f"{args.samples} campioni, {args.inputs} input, {len(model.rules)} regole, {cores} core")
+
+    start = time.perf_counter()
+    reference = batch_infer(model, X)["y"]
+    serial = time.perf_counter() - start
+    print(f"{'seriale':>10}: {serial:8.3f} s  {args.samples / serial:12,.0f} campioni/s")
+
+    for n in workers:
+        start = time.perf_counter()
+        result = parallel_batch_infer(model, X, workers=n, chunk_rows=args.chunk_size)["y"]
+        elapsed = time.perf_counter() - start
+        assert np.allclose(result, reference), "risultati diversi dall'esecuzione seriale"
+        print(f"{n:>3} worker: {elapsed:8.3f} s  {args.samples / elapsed:12,.0f} campioni/s  speedup {serial / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
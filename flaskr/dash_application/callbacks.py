@@ -1,5 +1,7 @@
 import dash
 import base64
+import csv
+import io
 from dash import dcc, html, Input, Output, State, ctx, ALL, MATCH, callback_context
 import plotly.graph_objects as go
 import requests
@@ -11,6 +13,9 @@ from datetime import datetime
 import re
 from dash.exceptions import PreventUpdate
 
+# Regole mostrate nella pagina di test, e quante se ne aggiungono con "Show more"
+TOP_K_RULES = 20
+
 def register_callbacks(dash_app):
 
     """Registra tutti i callback necessari all'app Dash per la gestione delle variabili fuzzy, regole e inferenza."""
@@ -41,6 +46,51 @@ def register_callbacks(dash_app):
                 return dash.no_update, ""
         return dash.no_update, ""
 
+    @dash_app.callback(
+        Output("control-surface-graph", "figure"),
+        Input("surface-x", "value"),
+        Input("surface-y", "value"),
+        Input("surface-output", "value"),
+        Input("surface-mode", "value")
+    )
+    def update_control_surface(x_var, y_var, output_var, mode):
+        """Disegna la superficie di controllo calcolata dal backend su una griglia 100x100."""
+        fig = go.Figure()
+        fig.update_layout(template="plotly_white", margin=dict(l=40, r=20, t=40, b=40))
+
+        if not x_var or not y_var or x_var == y_var:
+            fig.add_annotation(text="Select two different input variables.",
+                               xref="paper", yref="paper", showarrow=False, font=dict(size=16))
+            return fig
+
+        response = requests.post("http://127.0.0.1:5000/api/control_surface", json={
+            "x": x_var, "y": y_var, "outputs": [output_var], "nx": 100, "ny": 100
+        })
+        if response.status_code != 200:
+            message = response.json().get("error", "Error while computing the control surface.")
+            fig.add_annotation(text=message, xref="paper", yref="paper", showarrow=False,
+                               font=dict(size=16, color="red"))
+            return fig
+
+        data = response.json()
+        x = data["x"]["values"]
+        y = data["y"]["values"]
+        z = data["z"][output_var]
+        classes = data.get("classes", {}).get(output_var)
+        colorbar = dict(title=output_var)
+        if classes:
+            colorbar.update(tickvals=list(range(len(classes))), ticktext=classes)
+
+        if mode == "surface":
+            fig.add_trace(go.Surface(x=x, y=y, z=z, colorscale="Viridis", colorbar=colorbar))
+            fig.update_layout(scene=dict(xaxis_title=x_var, yaxis_title=y_var, zaxis_title=output_var))
+        else:
+            fig.add_trace(go.Heatmap(x=x, y=y, z=z, colorscale="Viridis", colorbar=colorbar))
+            fig.update_layout(xaxis_title=x_var, yaxis_title=y_var)
+
+        fig.update_layout(title=f"{output_var} as a function of {x_var} and {y_var}")
+        return fig
+
     @dash_app.callback(
     Output('url', 'pathname', allow_duplicate=True),
     Input('upload-fis', 'contents'),
@@ -250,6 +300,8 @@ def register_callbacks(dash_app):
             params.append(dbc.Input(id='param-d', style={'display': 'none'}))
             params.append(dbc.Input(id='param-mean', style={'display': 'none'}))
             params.append(dbc.Input(id='param-sigma', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-constant', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-coefficients', style={'display': 'none'}))
 
         elif function_type == 'Gaussian':
             params.append(dbc.Label("Parameter Mean:"))
@@ -261,6 +313,8 @@ def register_callbacks(dash_app):
             params.append(dbc.Input(id='param-b', style={'display': 'none'}))
             params.append(dbc.Input(id='param-c', style={'display': 'none'}))
             params.append(dbc.Input(id='param-d', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-constant', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-coefficients', style={'display': 'none'}))
 
         elif function_type == 'Trapezoidale':
             params.append(dbc.Label("Parameter a:"))
@@ -283,6 +337,23 @@ def register_callbacks(dash_app):
 
             params.append(dbc.Input(id='param-mean', style={'display': 'none'}))
             params.append(dbc.Input(id='param-sigma', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-constant', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-coefficients', style={'display': 'none'}))
+
+        elif function_type == 'Sugeno':
+            # Conseguente TSK: z = costante + somma dei coefficienti per gli input
+            params.append(dbc.Label("Constant:"))
+            params.append(dbc.Input(id='param-constant', type='number', value='', required=True))
+            params.append(dbc.Label("Coefficients (optional, first order):"))
+            params.append(dbc.Input(id='param-coefficients', type='text', value='',
+                                    placeholder="input_name=coefficient, ..."))
+
+            params.append(dbc.Input(id='param-a', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-b', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-c', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-d', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-mean', style={'display': 'none'}))
+            params.append(dbc.Input(id='param-sigma', style={'display': 'none'}))
 
         return params
 
@@ -334,13 +405,15 @@ def register_callbacks(dash_app):
             State('defuzzy-type', 'value'), 
             State('create-term-btn', 'children'),
             State('selected-term', 'data'),
+            State('param-constant', 'value'),
+            State('param-coefficients', 'value'),
         ],
         prevent_initial_call=True
     )
     def handle_terms(create_clicks, delete_clicks, modify_clicks, open_type,
                     var_type, variable_name, domain_min, domain_max, function_type,
                     term_name, param_a, param_b, param_c, param_d, param_mean, param_sigma,
-                    defuzzy_type, button_label, selected_term): 
+                    defuzzy_type, button_label, selected_term, param_constant, param_coefficients): 
         """Gestisce la creazione, modifica ed eliminazione dei termini fuzzy.""" 
         ctx = dash.ctx
 
@@ -378,7 +451,7 @@ def register_callbacks(dash_app):
                     open_type, var_type, variable_name, domain_min, domain_max,
                     function_type, term_name, param_a, param_b,
                     param_c, param_d, param_mean, param_sigma,
-                    defuzzy_type, selected_term
+                    defuzzy_type, selected_term, param_constant, param_coefficients
                 )
 
                 terms_list, figure, count = update_terms_list_and_figure(variable_name, var_type)
@@ -394,7 +467,7 @@ def register_callbacks(dash_app):
                     open_type, var_type, variable_name, domain_min, domain_max,
                     function_type, term_name, param_a, param_b,
                     param_c, param_d, param_mean, param_sigma,
-                    defuzzy_type
+                    defuzzy_type, param_constant, param_coefficients
                 )
 
                 if message == "Term successfully created!":
@@ -493,6 +566,43 @@ def register_callbacks(dash_app):
 
 
 
+    def sugeno_params(param_constant, param_coefficients):
+        """Costruisce i parametri di un termine Sugeno dal campo costante e dal testo 'input=coefficiente, ...'."""
+        if param_constant in (None, ''):
+            return None, "The constant of a Sugeno term is required."
+        coefficients = {}
+        for item in (param_coefficients or '').split(','):
+            if not item.strip():
+                continue
+            name, _, value = item.partition('=')
+            try:
+                if not name.strip():
+                    raise ValueError
+                coefficients[name.strip()] = float(value)
+            except ValueError:
+                return None, f"Invalid coefficient '{item.strip()}'. Use input_name=number."
+        return {'constant': float(param_constant), 'coefficients': coefficients}, ""
+
+    @dash_app.callback(
+        [
+            Output('param-constant', 'value', allow_duplicate=True),
+            Output('param-coefficients', 'value', allow_duplicate=True),
+        ],
+        Input('modify-term-btn', 'n_clicks'),
+        [State('variable-name', 'value'), State('selected-term', 'data')],
+        prevent_initial_call=True
+    )
+    def load_sugeno_params(modify_clicks, variable_name, selected_term):
+        """Riporta costante e coefficienti nel form quando si modifica un termine Sugeno."""
+        if not selected_term:
+            return dash.no_update, dash.no_update
+        response = requests.get(f'http://127.0.0.1:5000/api/get_term/{variable_name}/{selected_term}')
+        if response.status_code != 200 or response.json().get('function_type') != 'Sugeno':
+            return dash.no_update, dash.no_update
+        params = response.json().get('params', {})
+        coefficients = ', '.join(f"{name}={value}" for name, value in params.get('coefficients', {}).items())
+        return params.get('constant', ''), coefficients
+
     def validate_params(open_type, params, domain_min, domain_max, function_type):
         """Valida i parametri di un termine fuzzy rispetto al dominio e al tipo di funzione.""" 
         if function_type == 'Triangolare':
@@ -554,7 +664,7 @@ def register_callbacks(dash_app):
             
         return True, ""
 
-    def create_term(open_type, var_type, variable_name, domain_min, domain_max, function_type, term_name, param_a, param_b, param_c, param_d, param_mean, param_sigma, defuzzy_type=None):
+    def create_term(open_type, var_type, variable_name, domain_min, domain_max, function_type, term_name, param_a, param_b, param_c, param_d, param_mean, param_sigma, defuzzy_type=None, param_constant=None, param_coefficients=None):
         """Crea un nuovo termine fuzzy e aggiorna grafico e lista."""
         try:
             domain_min = int(domain_min)
@@ -592,6 +702,10 @@ def register_callbacks(dash_app):
                 params = {'a': param_a, 'b': param_b, 'c': param_d, 'd': param_d}
         elif function_type == 'Classification':
             params = {}  
+        elif function_type == 'Sugeno':
+            params, error_message = sugeno_params(param_constant, param_coefficients)
+            if params is None:
+                return dash.no_update, True, error_message, dash.no_update, dash.no_update
         is_valid, error_message = validate_params(open_type, params, domain_min, domain_max, function_type)
         if not is_valid:
             return dash.no_update, True, error_message, dash.no_update, dash.no_update
@@ -692,7 +806,7 @@ def register_callbacks(dash_app):
                 dash.no_update, dash.no_update
             )
 
-    def modify_term(open_type, var_type, variable_name, domain_min, domain_max, function_type, term_name, param_a, param_b, param_c, param_d, param_mean, param_sigma, defuzzy_type=None, selected_term=None):
+    def modify_term(open_type, var_type, variable_name, domain_min, domain_max, function_type, term_name, param_a, param_b, param_c, param_d, param_mean, param_sigma, defuzzy_type=None, selected_term=None, param_constant=None, param_coefficients=None):
         """Modifica un termine fuzzy esistente e aggiorna grafico e lista.""" 
         try:
             domain_min = int(domain_min)
@@ -727,6 +841,10 @@ def register_callbacks(dash_app):
                 params = {'a': param_a, 'b': param_b, 'c': param_d, 'd': param_d}
         elif function_type == 'Classification':
             params = {}
+        elif function_type == 'Sugeno':
+            params, error_message = sugeno_params(param_constant, param_coefficients)
+            if params is None:
+                return dash.no_update, True, error_message, dash.no_update, dash.no_update
 
         if function_type != 'Classification':
             is_valid, error_message = validate_params(open_type, params, domain_min, domain_max, function_type)
@@ -1247,6 +1365,41 @@ def register_callbacks(dash_app):
         return updated_rules
 
 
+    @dash_app.callback(
+        Output("rules-store", "data", allow_duplicate=True),
+        Output("upload-rules-feedback", "children"),
+        Input("upload-rules", "contents"),
+        State("rules-store", "data"),
+        prevent_initial_call=True
+    )
+    def upload_rule_table(contents, rules_data):
+        """Crea in blocco le regole di una tabella CSV con un'unica richiesta al backend."""
+        if not contents:
+            raise PreventUpdate
+        try:
+            content_type, content_string = contents.split(',')
+            text = base64.b64decode(content_string).decode('utf-8-sig')
+
+            response_vars = requests.get("http://127.0.0.1:5000/api/get_variables_and_terms")
+            output_variables = response_vars.json().get("output", {}) if response_vars.status_code == 200 else {}
+            rules, lines = parse_rule_table(text, output_variables)
+
+            response = requests.post("http://127.0.0.1:5000/api/create_rules", json={"rules": rules})
+            result = response.json()
+            if response.status_code != 201:
+                details = [html.Li(f"Row {lines[e['index']]}: {e['error']}") for e in result.get("errors", [])[:10]]
+                return dash.no_update, dbc.Alert(
+                    [html.Div(result.get("error", "Error while saving the rules")), html.Ul(details, className="mb-0")],
+                    color="danger", dismissable=True
+                )
+
+            new_rules = [{"id": rule_id, **rule} for rule_id, rule in zip(result["rule_ids"], rules)]
+            return (rules_data or []) + new_rules, dbc.Alert(result["message"], color="success", dismissable=True)
+
+        except Exception as e:
+            return dash.no_update, dbc.Alert(f"Error while reading the rule table: {e}", color="danger", dismissable=True)
+
+
                 
     @dash_app.callback(
         [Output("rules-store", "data"),
@@ -1353,13 +1506,20 @@ def register_callbacks(dash_app):
         Output("rules-list-membership", "children"),
         Output("membership-values", "children"),
         Output("winner-term-store", "data"),
+        Output("rules-top-k", "data"),
+        Output("show-more-rules", "style"),
         Input("start-inference", "n_clicks"),
+        Input("show-more-rules", "n_clicks"),
         State("inference-inputs", "children"),
         State("is-classification", "data"),
+        State("rules-top-k", "data"),
         prevent_initial_call=True
     )
-    def run_inference(n_clicks, input_children, is_classification):
-        """Esegue l'inferenza fuzzy sui valori inseriti e mostra attivazioni e output."""
+    def run_inference(n_clicks, show_more_clicks, input_children, is_classification, top_k):
+        """Esegue l'inferenza fuzzy sui valori inseriti e mostra le regole più attivate e gli output."""
+        # Un nuovo calcolo riparte dalle prime regole, "Show more" ne aggiunge altre
+        top_k = (top_k or TOP_K_RULES) + TOP_K_RULES if ctx.triggered_id == "show-more-rules" else TOP_K_RULES
+        hidden = {"display": "none"}
         try:
             inputs_dict = {}
             for col in input_children[0]["props"]["children"]:
@@ -1372,15 +1532,22 @@ def register_callbacks(dash_app):
                     except ValueError:
                         continue
 
-            response = requests.post("http://127.0.0.1:5000/api/infer", json={"inputs": inputs_dict})
+            response = requests.post("http://127.0.0.1:5000/api/infer", json={"inputs": inputs_dict, "top_k": top_k})
             if response.status_code != 200:
-                return dash.no_update, [html.Div("Error in inference", className="text-danger")], [], {}
+                return dash.no_update, [html.Div("Error in inference", className="text-danger")], [], {}, top_k, hidden
 
             result = response.json()
             rule_outputs = result.get("rule_outputs", [])
             outputs = result.get("results", {})
+            summary = result.get("rule_summary", {})
 
-            rules_display = []
+            rules_display = [
+                html.Small(
+                    f"Showing the {summary.get('returned', 0)} most activated of {summary.get('fired', 0)} "
+                    f"fired rules ({summary.get('total', 0)} in total)",
+                    className="d-block text-muted text-center mb-2"
+                )
+            ] if summary else []
             membership_values_display = []
 
             for rule in rule_outputs:
@@ -1414,11 +1581,12 @@ def register_callbacks(dash_app):
                 for var_name, result_value in outputs.items():
                     winner_term_store[var_name] = result_value
 
-            return result, rules_display, membership_values_display, winner_term_store
+            more_style = {} if summary.get("returned", 0) < summary.get("fired", 0) else hidden
+            return result, rules_display, membership_values_display, winner_term_store, top_k, more_style
 
         except Exception as e:
             print(f"Inference error: {e}")
-            return dash.no_update, [html.Div("Error during the inference process", className="text-danger")], [], {}
+            return dash.no_update, [html.Div("Error during the inference process", className="text-danger")], [], {}, top_k, hidden
 
 
     @dash_app.callback(
@@ -1493,7 +1661,8 @@ def register_callbacks(dash_app):
             )
             return True, fig
 
-        response = requests.post("http://127.0.0.1:5000/api/infer", json={"inputs": inputs_dict})
+        response = requests.post("http://127.0.0.1:5000/api/infer",
+                                 json={"inputs": inputs_dict, "verbosity": "results+activations"})
         if response.status_code != 200:
             fig = go.Figure()
             fig.add_annotation(
@@ -1559,10 +1728,25 @@ def fetch_data():
         return None
 
 
+def sugeno_consequent_label(term):
+    """Etichetta di un conseguente Sugeno nella forma 'nome: z = c + a·x'."""
+    params = term.get("params") or {}
+    formula = f"{params.get('constant', 0):g}"
+    for name, coefficient in (params.get("coefficients") or {}).items():
+        formula += f" {'-' if coefficient < 0 else '+'} {abs(coefficient):g}·{name}"
+    return f"{term['term_name']}: z = {formula}"
+
+
 def generate_variable_section(variables, var_type):
     """Genera le card per visualizzare le variabili (input/output) nel report.""" 
     children = []
     for var_name, var_data in variables.items():
+        terms = var_data["terms"]
+        is_sugeno = bool(terms) and all(term.get("function_type") == "Sugeno" for term in terms)
+        type_label = var_type.capitalize()
+        if is_sugeno:
+            order = "first-order" if any((t.get("params") or {}).get("coefficients") for t in terms) else "zero-order"
+            type_label += f" (Sugeno TSK, {order})"
         children.append(
             dbc.Card([
                 dbc.CardHeader(f"{var_type.capitalize()} Variable: {var_name}"),
@@ -1571,15 +1755,16 @@ def generate_variable_section(variables, var_type):
                         html.H5(var_name, className="text-primary mb-2" if var_type == "input" else "text-success mb-2"),
                         dbc.Row([
                             dbc.Col(f"Domain: {var_data['domain'][0]}-{var_data['domain'][1]}", width=6),
-                            dbc.Col(f"Type: {var_type.capitalize()}", width=6),
+                            dbc.Col(f"Type: {type_label}", width=6),
                         ]),
                         html.Div(
                             className="mt-2",
                             children=[
-                                html.Small("Membership Functions:", className="text-muted"),
+                                html.Small("Consequents:" if is_sugeno else "Membership Functions:", className="text-muted"),
                                 html.Div([
-                                    dbc.Badge(term["term_name"], color="info" if var_type == "input" else "secondary", className="me-1")
-                                    for term in var_data["terms"]
+                                    dbc.Badge(sugeno_consequent_label(term) if is_sugeno else term["term_name"],
+                                              color="info" if var_type == "input" else "secondary", className="me-1")
+                                    for term in terms
                                 ], className="mt-1")
                             ]
                         )
@@ -1609,3 +1794,84 @@ def generate_rules_section(rules):
     return children
 
 
+def parse_rule_table(text, output_variables):
+    """Legge una tabella di regole CSV: intestazione con i nomi delle variabili, una riga per regola.
+
+    Ogni cella contiene il termine della variabile; una cella vuota (o '-') indica un input non
+    usato dalla regola. Restituisce (regole per /api/create_rules, numero di riga di ciascuna).
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = [name.strip() for name in next(reader, [])]
+
+    output_columns = [i for i, name in enumerate(header) if name in output_variables]
+    if len(output_columns) != 1:
+        raise ValueError("The header must contain exactly one column named after the output variable")
+    output_column = output_columns[0]
+
+    rules, lines = [], []
+    for line, row in enumerate(reader, start=2):
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        cells += [""] * (len(header) - len(cells))
+        rules.append({
+            "inputs": [
+                {"input_variable": name, "input_term": cells[i]}
+                for i, name in enumerate(header)
+                if i != output_column and cells[i] not in ("", "-")
+            ],
+            "output_variable": header[output_column],
+            "output_term": cells[output_column]
+        })
+        lines.append(line)
+    if not rules:
+        raise ValueError("The file does not contain any rule")
+    return rules, lines
+
+
+def generate_surface_section(terms):
+    """Genera i controlli e il grafico della superficie di controllo nel report."""
+    input_names = list(terms.get("input", {}).keys())
+    output_names = list(terms.get("output", {}).keys())
+
+    if len(input_names) < 2 or not output_names:
+        return [html.P("The control surface needs at least two input variables and one output variable.",
+                       className="text-muted")]
+
+    return [
+        dbc.Row([
+            dbc.Col([
+                dbc.Label("X Axis", className="mb-0"),
+                dcc.Dropdown(id="surface-x", options=input_names, value=input_names[0],
+                             clearable=False, className="custom-dropdown mb-3")
+            ], md=3),
+            dbc.Col([
+                dbc.Label("Y Axis", className="mb-0"),
+                dcc.Dropdown(id="surface-y", options=input_names, value=input_names[1],
+                             clearable=False, className="custom-dropdown mb-3")
+            ], md=3),
+            dbc.Col([
+                dbc.Label("Output", className="mb-0"),
+                dcc.Dropdown(id="surface-output", options=output_names, value=output_names[0],
+                             clearable=False, className="custom-dropdown mb-3")
+            ], md=3),
+            dbc.Col([
+                dbc.Label("View", className="mb-0"),
+                dbc.RadioItems(
+                    id="surface-mode",
+                    options=[
+                        {"label": "Heatmap", "value": "heatmap"},
+                        {"label": "Surface", "value": "surface"}
+                    ],
+                    value="heatmap",
+                    inline=True
+                )
+            ], md=3),
+        ]),
+        html.Small("Other inputs are held at the middle of their domain.", className="text-muted"),
+        dcc.Loading(dcc.Graph(id="control-surface-graph", style={"height": "550px"}), type="circle")
+    ]
@@ -17,6 +17,8 @@ def layout() -> html.Div:
         dcc.Input(id='param-d', type='number', style={'display': 'none'}),
         dcc.Input(id='param-mean', type='number', style={'display': 'none'}),
         dcc.Input(id='param-sigma', type='number', style={'display': 'none'}),
+        dcc.Input(id='param-constant', type='number', style={'display': 'none'}),
+        dcc.Input(id='param-coefficients', type='text', style={'display': 'none'}),
         dcc.Input(id='domain-min', type='number', value='0', style={'display': 'none'}),
         dcc.Input(id='domain-max', type='number', value='1', style={'display': 'none'}),
         dcc.Dropdown(id='defuzzy-type', options=[], style={'display': 'none'}),
@@ -72,6 +72,7 @@ def layout() -> html.Div:
                                             {'label': 'Triangular', 'value': 'Triangolare'},
                                             {'label': 'Trapezoidal', 'value': 'Trapezoidale'},
                                             {'label': 'Gaussian', 'value': 'Gaussian'},
+                                            {'label': 'Sugeno (TSK)', 'value': 'Sugeno'},
                                         ],
                                         placeholder="Select...",
                                         className="custom-dropdown mb-3",
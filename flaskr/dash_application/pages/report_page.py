@@ -1,7 +1,7 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 import requests
-from ..callbacks import fetch_data, generate_variable_section, generate_rules_section
+from ..callbacks import fetch_data, generate_variable_section, generate_rules_section, generate_surface_section
 
 def layout():
     """Main function that generates the page layout."""
@@ -16,6 +16,7 @@ def layout():
     input_children = generate_variable_section(terms.get("input", {}), "input")
     output_children = generate_variable_section(terms.get("output", {}), "output")
     rules_children = generate_rules_section(rules)
+    surface_children = generate_surface_section(terms)
 
     return html.Div(
         className="container-fluid p-4",
@@ -67,6 +68,15 @@ def layout():
                                     ], className="shadow-sm")
                                 ]),
                             ], className="mb-4"),
+
+                            dbc.Row([
+                                dbc.Col([
+                                    dbc.Card([
+                                        dbc.CardHeader("Control Surface", className="gradient-header"),
+                                        dbc.CardBody(surface_children)
+                                    ], className="shadow-sm")
+                                ]),
+                            ], className="mb-4"),
                         ]),
                         
                         dbc.CardFooter(
@@ -73,6 +73,35 @@ def layout() -> html.Div:
                                 ),
                                 className="d-flex justify-content-center pt-3"
                             ),
+
+                            # Caricamento in blocco di una tabella di regole CSV
+                            html.Div(
+                                className="d-flex flex-column align-items-center pt-3",
+                                children=[
+                                    dcc.Upload(
+                                        id="upload-rules",
+                                        children=dbc.Button(
+                                            [html.I(className="fas fa-file-csv", style={"marginRight": "8px"}), "Upload Rule Table"],
+                                            color="secondary",
+                                            className="action-btn"
+                                        ),
+                                        accept=".csv",
+                                        multiple=False
+                                    ),
+                                    html.Span(
+                                        "CSV with one column per variable (header = variable names) and one rule per row; "
+                                        "leave a cell empty to skip that input.",
+                                        style={
+                                            "color": "#6c757d",
+                                            "fontSize": "0.8rem",
+                                            "fontStyle": "italic",
+                                            "maxWidth": "500px",
+                                            "textAlign": "center"
+                                        }
+                                    ),
+                                    html.Div(id="upload-rules-feedback", className="mt-2")
+                                ]
+                            ),
                             
                             html.Div(
                                 id="rules-list", 
@@ -80,6 +80,7 @@ def layout() -> html.Div:
         dcc.Store(id='rule-memberships', data={}),
         dcc.Store(id='is-classification', data=is_classification_global),
         dcc.Store(id="winner-term-store", data={}),
+        dcc.Store(id="rules-top-k"),
         dcc.Store(id="inference-input-ids", data=[f"{var}-input" for var in terms.get("input", {})]),
 
         html.Div(
@@ -144,8 +145,14 @@ def layout() -> html.Div:
                                                 style={"color": "#2c3e50"}
                                             ),
                                             dbc.Row([
-                                                dbc.Col(
+                                                dbc.Col([
                                                     html.Div(id="rules-list-membership", className="rule-membership-container"),
+                                                    html.Div(
+                                                        dbc.Button("Show more", id="show-more-rules", color="link",
+                                                                   size="sm", style={"display": "none"}),
+                                                        className="d-flex justify-content-center"
+                                                    )
+                                                ],
                                                     md=8,
                                                     className="mx-auto"
                                                 )
@@ -0,0 +1,322 @@
+import math
+import numpy as np
+
+try:
+    from scipy.special import erf
+except ImportError:  # scipy arriva con scikit-fuzzy, ma non è una dipendenza diretta
+    erf = np.vectorize(math.erf, otypes=[float])
+
+LINEAR_TYPES = ("Triangolare", "Trapezoidale")
+
+# Metodi offerti dal menu 'defuzzy-type' della pagina di output
+METHODS = ("centroid", "bisector", "mom", "som", "lom")
+
+# Costo relativo di una valutazione di termine dell'integrazione esatta rispetto a un punto della
+# griglia (misurato su output gaussiani): oltre la soglia conviene campionare
+EXACT_COST_RATIO = 4
+
+
+def output_method(terms):
+    """Metodo di defuzzificazione salvato sui termini di output, 'centroid' se nessuno lo indica.
+
+    Il metodo vale per tutta la variabile: valori diversi fra i termini o sconosciuti sono un errore
+    (le API li rifiutano o li allineano in scrittura, qui possono arrivare solo da sessioni vecchie).
+    """
+    methods = {(term.get("defuzzy_type") or "").lower() for term in terms} - {""}
+    if len(methods) > 1:
+        raise ValueError(f"The output terms disagree on the defuzzification method ({', '.join(sorted(methods))}); "
+                         "set the same defuzzy_type on all of them")
+    method = methods.pop() if methods else "centroid"
+    if method not in METHODS:
+        raise ValueError(f"Unknown defuzzification method: {method}")
+    return method
+
+
+def defuzzify_batch(x, aggregated, method):
+    """Defuzzifica ogni riga di una matrice (campioni x griglia) con il metodo indicato; 0 se l'insieme è vuoto."""
+    if method == "bisector":
+        result = bisector_batch(x, aggregated)
+    elif method == "mom":
+        result = mom_batch(x, aggregated)
+    elif method == "som":
+        result = som_batch(x, aggregated)
+    elif method == "lom":
+        result = lom_batch(x, aggregated)
+    else:
+        result = centroid_batch(x, aggregated)
+    result[aggregated.sum(axis=1) == 0] = 0.0
+    return result
+
+
+def _segment_areas(x, aggregated):
+    """Aree dei trapezi fra punti consecutivi della griglia (interpolazione lineare)."""
+    return 0.5 * np.diff(x) * (aggregated[:, :-1] + aggregated[:, 1:])
+
+
+def centroid_batch(x, aggregated):
+    """Centroide esatto dell'interpolante lineare di ciascuna riga; 0 se l'insieme aggregato è vuoto."""
+    y1, y2 = aggregated[:, :-1], aggregated[:, 1:]
+    x1, h = x[:-1], np.diff(x)
+    area = _segment_areas(x, aggregated).sum(axis=1)
+    moment = (h / 6.0 * (x1 * (2 * y1 + y2) + (x1 + h) * (y1 + 2 * y2))).sum(axis=1)
+    result = moment / np.fmax(area, np.finfo(float).eps)
+    result[aggregated.sum(axis=1) == 0] = 0.0
+    return result
+
+
+def bisector_batch(x, aggregated):
+    """Bisettrice: punto che divide l'area a metà, trovato con le somme cumulative delle aree."""
+    cumulative = np.cumsum(_segment_areas(x, aggregated), axis=1)
+    half = 0.5 * cumulative[:, -1]
+    index = np.argmax(cumulative >= half[:, None], axis=1)
+
+    rows = np.arange(aggregated.shape[0])
+    before = np.where(index > 0, cumulative[rows, np.maximum(index - 1, 0)], 0.0)
+    subarea = half - before
+    x1, x2 = x[index], x[index + 1]
+    y1, y2 = aggregated[rows, index], aggregated[rows, index + 1]
+
+    # Nel segmento y = y1 + m (u - x1): si risolve y1 t + m t^2 / 2 = subarea
+    slope = (y2 - y1) / (x2 - x1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(np.fmax(y1 * y1 + 2.0 * slope * subarea, 0.0))
+        sloped = x1 - (y1 - root) / slope
+        flat = x1 + subarea / y1
+    return np.where(slope == 0, flat, sloped)
+
+
+def _maxima(aggregated):
+    return aggregated == aggregated.max(axis=1, keepdims=True)
+
+
+def mom_batch(x, aggregated):
+    """Media dei massimi."""
+    mask = _maxima(aggregated)
+    return (mask * x).sum(axis=1) / mask.sum(axis=1)
+
+
+def som_batch(x, aggregated):
+    """Più piccolo dei massimi."""
+    return x[np.argmax(_maxima(aggregated), axis=1)]
+
+
+def lom_batch(x, aggregated):
+    """Più grande dei massimi."""
+    mask = _maxima(aggregated)
+    return x[len(x) - 1 - np.argmax(mask[:, ::-1], axis=1)]
+
+
+class ExactCentroid:
+    """Centroide calcolato integrando in forma chiusa l'insieme aggregato max-min, senza griglia.
+
+    I termini triangolari/trapezoidali producono un insieme lineare a tratti; i termini
+    gaussiani vengono integrati con erf. Per combinazioni miste ``supported`` è False
+    e il chiamante deve ricorrere al campionamento. Con grid_points, anche quando il costo
+    stimato per campione supera quello di una griglia di grid_points punti.
+    """
+
+    def __init__(self, terms, domain, grid_points=None):
+        self.lo, self.hi = float(domain[0]), float(domain[1])
+        types = {term.get("function_type") for term in terms}
+        self.mode = None
+        if terms and types <= set(LINEAR_TYPES):
+            self.mode = "linear"
+            self._compile_linear(terms)
+        elif terms and types == {"Gaussian"}:
+            self.mode = "gaussian"
+            self._compile_gaussian(terms)
+        if self.mode is not None and grid_points and EXACT_COST_RATIO * self.work_per_sample > grid_points * self.n_terms:
+            self.mode = None
+
+    @property
+    def supported(self):
+        return self.mode is not None
+
+    @property
+    def points_per_sample(self):
+        """Numero di punti di rottura candidati per campione."""
+        if not self.supported:
+            return 0
+        return len(self.fixed_points) + 2 * len(self.cross_term)
+
+    @property
+    def work_per_sample(self):
+        """Valutazioni di termini per campione (stima del costo e della memoria temporanea)."""
+        if self.mode is None:
+            return 0
+        return (len(self.fixed_points) + 2 * len(self.cross_term)) * self.candidates.shape[1]
+
+    # === Compilazione ===
+    def _compile_linear(self, terms):
+        abcd = []
+        for term in terms:
+            p = term["params"]
+            if term["function_type"] == "Triangolare":
+                abcd.append([p["a"], p["b"], p["b"], p["c"]])
+            else:
+                abcd.append([p["a"], p["b"], p["c"], p["d"]])
+        self.abcd = np.array(abcd, dtype=float)
+        self.n_terms = len(terms)
+        a, b, c, d = self.abcd.T
+
+        # Coppie di termini con supporti sovrapposti: solo fra queste l'insieme aggregato può
+        # passare da un termine all'altro (il livello di taglio di j incontra i lati di i)
+        overlap = (a[:, None] < d[None, :]) & (a[None, :] < d[:, None])
+        np.fill_diagonal(overlap, True)
+        self.cross_term, self.cross_level = np.nonzero(overlap)
+
+        # Rette dei lati: y = slope * x + intercept (solo lati non verticali)
+        lines = []
+        for i in range(self.n_terms):
+            if b[i] > a[i]:
+                lines.append((i, 1.0 / (b[i] - a[i]), -a[i] / (b[i] - a[i])))
+            if d[i] > c[i]:
+                lines.append((i, -1.0 / (d[i] - c[i]), d[i] / (d[i] - c[i])))
+
+        points = [self.lo, self.hi, *self.abcd.ravel()]
+        for k in range(len(lines)):
+            for l in range(k + 1, len(lines)):
+                (i, m1, q1), (j, m2, q2) = lines[k], lines[l]
+                if m1 != m2 and overlap[i, j]:
+                    points.append((q2 - q1) / (m1 - m2))
+        self.fixed_points = self._in_domain(points)
+
+        # Fra due vertici consecutivi l'insieme dei termini con supporto non nullo non cambia:
+        # per ogni intervallo si tengono solo quei termini (ripetendo il primo per pareggiare le righe)
+        self.corners = self._in_domain([self.lo, self.hi, *self.abcd.ravel()])
+        mid = 0.5 * (self.corners[:-1] + self.corners[1:]) if len(self.corners) > 1 else self.corners
+        inside = (a[None, :] < mid[:, None]) & (mid[:, None] < d[None, :])
+        width = max(1, int(inside.sum(axis=1).max(initial=0)))
+        self.candidates = np.zeros((len(mid), width), dtype=np.intp)
+        for k, row in enumerate(inside):
+            found = np.flatnonzero(row)
+            if len(found):
+                self.candidates[k] = np.resize(found, width)
+
+    def _compile_gaussian(self, terms):
+        self.mean = np.array([term["params"]["mean"] for term in terms], dtype=float)
+        self.sigma = np.array([term["params"]["sigma"] for term in terms], dtype=float)
+        self.n_terms = len(terms)
+
+        # Intersezioni fra coppie di gaussiane: uguaglianza degli esponenti (quadratica in x)
+        points = [self.lo, self.hi, *self.mean]
+        for i in range(self.n_terms):
+            for j in range(i + 1, self.n_terms):
+                m1, s1, m2, s2 = self.mean[i], self.sigma[i], self.mean[j], self.sigma[j]
+                qa = s2 ** 2 - s1 ** 2
+                qb = -2.0 * (m1 * s2 ** 2 - m2 * s1 ** 2)
+                qc = m1 ** 2 * s2 ** 2 - m2 ** 2 * s1 ** 2
+                if qa == 0:
+                    if qb != 0:
+                        points.append(-qc / qb)
+                    continue
+                disc = qb ** 2 - 4 * qa * qc
+                if disc >= 0:
+                    points.extend([(-qb - math.sqrt(disc)) / (2 * qa), (-qb + math.sqrt(disc)) / (2 * qa)])
+        self.fixed_points = self._in_domain(points)
+        # Le gaussiane hanno supporto illimitato: tutte le coppie e tutti i termini sono candidati
+        self.cross_term, self.cross_level = np.divmod(np.arange(self.n_terms * self.n_terms), self.n_terms)
+        self.candidates = np.arange(self.n_terms)[None, :]
+
+    def _in_domain(self, points):
+        points = np.asarray(points, dtype=float)
+        return np.unique(points[(points >= self.lo) & (points <= self.hi)])
+
+    # === Valutazione ===
+    def __call__(self, activations):
+        """Centroide per ciascuna riga di attivazioni (campioni x termini)."""
+        n_samples = activations.shape[0]
+        w = np.clip(activations, 0.0, 1.0)
+
+        # Punti in cui il livello di taglio w_j incontra i lati dei termini i (coppie cross_term, cross_level)
+        i, j = self.cross_term, self.cross_level
+        if self.mode == "linear":
+            a, b, c, d = self.abcd.T
+            rising = a[i] + w[:, j] * (b - a)[i]
+            falling = d[i] - w[:, j] * (d - c)[i]
+            moving = np.concatenate([rising, falling], axis=1)
+        else:
+            with np.errstate(divide="ignore"):
+                spread = np.sqrt(np.fmax(-2.0 * np.log(w[:, j]), 0.0))
+            offset = self.sigma[i] * spread
+            moving = np.concatenate([self.mean[i] - offset, self.mean[i] + offset], axis=1)
+            moving[~np.isfinite(moving)] = self.lo
+
+        points = np.concatenate([np.broadcast_to(self.fixed_points, (n_samples, len(self.fixed_points))), moving], axis=1)
+        points = np.sort(np.clip(points, self.lo, self.hi), axis=1)
+        left, right = points[:, :-1], points[:, 1:]
+        mid = 0.5 * (left + right)
+
+        # Nel segmento l'insieme aggregato coincide con un solo pezzo: quello attivo nel punto medio
+        if self.mode == "linear":
+            area, moment = self._integrate_linear(w, left, right, mid)
+        else:
+            area, moment = self._integrate_gaussian(w, left, right, mid)
+
+        total_area = area.sum(axis=1)
+        result = moment.sum(axis=1) / np.fmax(total_area, np.finfo(float).eps)
+        result[total_area <= 0] = 0.0
+        return result
+
+    def _integrate_linear(self, w, left, right, mid):
+        # Ogni segmento cade in un solo intervallo fra vertici: si confrontano solo i suoi termini candidati
+        interval = np.clip(np.searchsorted(self.corners, mid, side="right") - 1, 0, len(self.candidates) - 1)
+        candidates = self.candidates[interval]
+        rows = np.arange(w.shape[0])[:, None]
+        a, b, c, d = (column[candidates] for column in self.abcd.T)
+        mu = _trapezoid(mid[:, :, None], a, b, c, d)
+        clipped = np.fmin(mu, w[rows[:, :, None], candidates])
+        choice = clipped.argmax(axis=2)[:, :, None]
+        best = np.take_along_axis(candidates, choice, axis=2)[:, :, 0]
+
+        wb = w[rows, best]
+        a, b, c, d = self.abcd.T
+        ab, bb, cb, db = a[best], b[best], c[best], d[best]
+        is_level = wb <= np.take_along_axis(mu, choice, axis=2)[:, :, 0]
+
+        def piece(x):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                up = (x - ab) / (bb - ab)
+                down = (db - x) / (db - cb)
+            value = np.where(mid < ab, 0.0, np.where(mid < bb, up, np.where(mid <= cb, 1.0, np.where(mid < db, down, 0.0))))
+            return np.where(is_level, wb, value)
+
+        fl, fr = piece(left), piece(right)
+        h = right - left
+        area = 0.5 * h * (fl + fr)
+        moment = h / 6.0 * (left * (2 * fl + fr) + right * (fl + 2 * fr))
+        return area, moment
+
+    def _integrate_gaussian(self, w, left, right, mid):
+        g_mid = np.exp(-((mid[:, :, None] - self.mean) ** 2) / (2.0 * self.sigma ** 2))
+        clipped = np.fmin(g_mid, w[:, None, :])
+        best = clipped.argmax(axis=2)
+
+        rows = np.arange(w.shape[0])[:, None]
+        wb = w[rows, best]
+        mb, sb = self.mean[best], self.sigma[best]
+        is_level = wb <= g_mid[rows, np.arange(mid.shape[1])[None, :], best]
+
+        root2 = math.sqrt(2.0)
+        g_left = np.exp(-((left - mb) ** 2) / (2.0 * sb ** 2))
+        g_right = np.exp(-((right - mb) ** 2) / (2.0 * sb ** 2))
+        gauss_area = sb * math.sqrt(math.pi / 2.0) * (erf((right - mb) / (sb * root2)) - erf((left - mb) / (sb * root2)))
+        gauss_moment = mb * gauss_area - sb ** 2 * (g_right - g_left)
+
+        area = np.where(is_level, wb * (right - left), gauss_area)
+        moment = np.where(is_level, wb * 0.5 * (right ** 2 - left ** 2), gauss_moment)
+        return area, moment
+
+
+def _trapezoid(x, a, b, c, d):
+    """Trapezio (a, b, c, d) valutato in forma chiusa con broadcasting sui termini.
+
+    I lati verticali diventano pendenze enormi: differiscono dal gradino solo nel punto a (o d),
+    dove i segmenti integrati hanno ampiezza nulla.
+    """
+    rise = 1.0 / np.fmax(b - a, 1e-300)
+    fall = 1.0 / np.fmax(d - c, 1e-300)
+    with np.errstate(over="ignore", invalid="ignore"):
+        up = (x - a) * rise
+        np.minimum(up, (d - x) * fall, out=up)
+    return np.clip(up, 0.0, 1.0, out=up)
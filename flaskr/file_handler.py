@@ -1,10 +1,29 @@
 import os
-import json
-from flask import request
+import threading
+from contextlib import contextmanager
+from flask import request, current_app, has_app_context
 import hashlib
 
+from flaskr.storage import (JSONStorage, JournalStorage, SQLiteStorage, VERSION_KEY,
+                            JOURNAL_COMPACT_BYTES, file_lock, lock_path)
+
 BASE_DIR = "instance/user_files"
 
+# Backend di persistenza: 'json' (un file per sessione, default), 'journal' (snapshot JSON più
+# journal append-only delle modifiche) o 'sqlite'. Si sceglie con STORAGE_BACKEND nella config
+# dell'app o nell'ambiente; il database SQLite è DATABASE nella config (come in create_app)
+# oppure la variabile d'ambiente DATABASE_PATH, la soglia di compattazione del journal
+# JOURNAL_COMPACT_BYTES. Prima di tornare da 'journal' a 'json' i journal vanno compattati
+# (JournalStorage.compact), perché il backend JSON legge solo gli snapshot.
+DEFAULT_BACKEND = "json"
+DEFAULT_DATABASE = os.path.join("instance", "flaskr.sqlite")
+
+_BACKENDS = {}
+_BACKENDS_LOCK = threading.Lock()
+
+# Lock di sessione già posseduti dal thread corrente (il lock è rientrante)
+_HELD_LOCKS = threading.local()
+
 def get_session_id():
     """Crea un identificativo di sessione basato sul browser senza autenticazione."""
     user_info = request.headers.get('User-Agent', '') + request.remote_addr
@@ -17,46 +36,142 @@ def get_session_file():
     session_id = get_session_id()
     return os.path.join(BASE_DIR, f"session_{session_id}.json")
 
+def get_storage():
+    """Backend di persistenza configurato (un'istanza per processo e per percorso)."""
+    config = current_app.config if has_app_context() else {}
+    backend = config.get("STORAGE_BACKEND") or os.getenv("STORAGE_BACKEND", DEFAULT_BACKEND)
+    if backend == "sqlite":
+        path = config.get("DATABASE") or os.getenv("DATABASE_PATH") or DEFAULT_DATABASE
+        key = ("sqlite", path)
+    elif backend in ("json", "journal"):
+        key = (backend, BASE_DIR)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    with _BACKENDS_LOCK:
+        if key not in _BACKENDS:
+            if backend == "journal":
+                compact_bytes = config.get("JOURNAL_COMPACT_BYTES") or os.getenv("JOURNAL_COMPACT_BYTES")
+                _BACKENDS[key] = JournalStorage(BASE_DIR, int(compact_bytes or JOURNAL_COMPACT_BYTES))
+            else:
+                legacy = _BACKENDS.setdefault(("json", BASE_DIR), JSONStorage(BASE_DIR))
+                _BACKENDS[key] = SQLiteStorage(key[1], legacy=legacy) if backend == "sqlite" else legacy
+        return _BACKENDS[key]
+
+
+@contextmanager
+def session_lock():
+    """Lock consultivo esclusivo sulla sessione, condiviso fra thread e processi (worker).
+
+    È rientrante nello stesso thread, così le scritture fatte mentre il lock è già
+    posseduto (ad es. per tutta la durata di una richiesta) non si bloccano da sole.
+    """
+    os.makedirs(BASE_DIR, exist_ok=True)
+    path = lock_path(BASE_DIR, get_session_id())
+    held = _HELD_LOCKS.__dict__.setdefault("paths", set())
+    if path in held:
+        yield
+        return
+
+    with file_lock(path):
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+
+
+def session_version():
+    """Versione corrente del modello della sessione (0 se la sessione non esiste o non è versionata)."""
+    return get_storage().version(get_session_id())
+
+
 def save_data(data):
-    """Salva i dati dell'utente in un file JSON."""
-    os.makedirs(BASE_DIR, exist_ok=True)  
-    file_path = get_session_file()
+    """Salva i dati dell'utente nel backend configurato."""
     try:
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=4)
+        with session_lock():
+            get_storage().save(get_session_id(), data)
     except Exception as e:
         print(f"Error while saving data: {e}")
         raise
 
-def load_data():
-    """Carica i dati dell'utente dalla sessione, se esistono."""
-    file_path = get_session_file()
+def load_data(readonly=False):
+    """Carica i dati dell'utente dalla sessione, se esistono.
+
+    Con readonly=True restituisce l'oggetto condiviso, che non va modificato; altrimenti una copia.
+    """
     try:
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                return json.load(f)
+        return get_storage().load(get_session_id(), readonly)
     except Exception as e:
         print(f"Error while loading data: {e}")
     return {}  
 
-def load_terms():
-    """Carica i dati dal file JSON, se esiste."""
-    file_path = get_session_file()
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    return {}
+def load_terms(readonly=False):
+    """Carica i dati della sessione, se esiste."""
+    return get_storage().load(get_session_id(), readonly)
 
 def save_terms(data):
-    """Salva i dati nel file JSON."""
-    os.makedirs(BASE_DIR, exist_ok=True)  
-    file_path = get_session_file()
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+    """Salva i dati della sessione."""
+    save_data(data)
         
-def load_rule():
-    file_path = get_session_file()
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            return json.load(f)
-    return {"rules": [], "dropdown_options": []}
+def load_rule(readonly=False):
+    data = get_storage().load(get_session_id(), readonly)
+    return data if data else {"rules": [], "dropdown_options": []}
+
+def load_settings():
+    """Restituisce le impostazioni della sessione (chiave 'settings'), vuote se assenti."""
+    settings = load_data().get("settings")
+    return settings if isinstance(settings, dict) else {}
+
+def save_settings(settings):
+    """Salva le impostazioni della sessione lasciando invariati termini e regole."""
+    data = load_data()
+    data["settings"] = settings
+    save_data(data)
+
+# === Operazioni granulari su termini e regole (righe singole con il backend SQLite) ===
+
+def get_variable(var_type, name):
+    """Copia della variabile della sessione, None se non esiste."""
+    return get_storage().get_variable(get_session_id(), var_type, name)
+
+def variable_names(var_type):
+    return get_storage().variable_names(get_session_id(), var_type)
+
+def find_term(term_name, variable_name=None):
+    """(tipo, variabile, termine) del termine cercato, None se non esiste."""
+    return get_storage().find_term(get_session_id(), term_name, variable_name)
+
+def store_term(var_type, var_name, domain, term):
+    with session_lock():
+        get_storage().add_term(get_session_id(), var_type, var_name, domain, term)
+
+def replace_term(var_type, var_name, term_name, term):
+    with session_lock():
+        get_storage().update_term(get_session_id(), var_type, var_name, term_name, term)
+
+def store_terms(entries):
+    """Aggiunge più termini (tipo, variabile, dominio, termine) con un'unica scrittura."""
+    with session_lock():
+        get_storage().add_terms(get_session_id(), entries)
+
+def remove_term(var_type, var_name, term_name):
+    with session_lock():
+        get_storage().delete_term(get_session_id(), var_type, var_name, term_name)
+
+def next_rule_id():
+    return get_storage().next_rule_id(get_session_id())
+
+def store_rule(rule_id, rule):
+    with session_lock():
+        get_storage().add_rule(get_session_id(), rule_id, rule)
+
+def store_rules(rules):
+    """Aggiunge più regole con un'unica scrittura; restituisce gli id assegnati."""
+    with session_lock():
+        return get_storage().add_rules(get_session_id(), rules)
+
+def remove_rule(rule_id):
+    """Elimina la regola; False se non esiste."""
+    with session_lock():
+        return get_storage().delete_rule(get_session_id(), rule_id)
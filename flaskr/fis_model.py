@@ -0,0 +1,707 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from flaskr import membership
+from flaskr.defuzzify import ExactCentroid, defuzzify_batch, output_method
+from flaskr.lookup import LookupTable, LOOKUP_GRID_POINTS
+from flaskr.file_handler import get_session_id, load_terms, VERSION_KEY
+from flaskr.result_cache import discard_session_results
+
+# Risoluzione della griglia su cui vengono campionati i termini di output (default, se non
+# impostata nella sezione 'resolution' delle impostazioni di sessione)
+OUTPUT_RESOLUTION = 1000
+
+# Limiti della risoluzione adattiva e stima dell'errore: la griglia scelta viene confrontata con
+# una griglia di riferimento molto fine su attivazioni casuali (sempre le stesse)
+MIN_RESOLUTION = 50
+MAX_RESOLUTION = 20000
+REFERENCE_RESOLUTION = 80000
+PROBE_SAMPLES = 32
+
+# Numero massimo di elementi temporanei per blocco di campioni nell'inferenza batch
+BATCH_BUDGET = 4_000_000
+
+# Numero massimo di curve di output campionate mantenute in cache (LRU)
+CURVE_CACHE_SIZE = 512
+
+# Oltre questa frazione del costo della valutazione densa conviene la gather su tutte le regole
+SPARSE_RULE_FRACTION = 0.1
+SPARSE_PROBE_ROWS = 64
+
+# Superfici di controllo mantenute in cache (per tutti i modelli del processo)
+SURFACE_CACHE_SIZE = 64
+
+# Modelli compilati mantenuti in cache (uno per sessione, LRU)
+MODEL_CACHE_SIZE = 32
+
+# Lavoro massimo (campioni x elementi per campione) di una superficie di controllo: oltre questa
+# soglia la griglia viene diradata per restare interattiva (circa un secondo)
+SURFACE_BUDGET = 250_000_000
+
+# Cache LRU di processo dei modelli compilati: session_id -> {"version", "model"}
+_MODEL_CACHE = OrderedDict()
+_MODEL_LOCK = threading.Lock()
+
+# Cache LRU delle curve di output: (variabile, tipo, parametri, dominio, risoluzione) -> array
+_CURVE_CACHE = OrderedDict()
+_CURVE_LOCK = threading.Lock()
+
+# Cache LRU delle superfici di controllo: (hash del modello, specifica della griglia) -> superficie.
+# Sta fuori da FISModel così il modello compilato resta serializzabile (pool di processi)
+_SURFACE_CACHE = OrderedDict()
+_SURFACE_LOCK = threading.Lock()
+
+
+class FISModel:
+    """Rappresentazione compilata di una sessione FIS, costruita una sola volta e riusata da /infer."""
+
+    def __init__(self, data):
+        self.data = data
+        # Impronta del contenuto del modello (termini, regole, impostazioni) per le cache dei risultati
+        self.model_hash = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+        # === Regole ===
+        self.rule_ids = [key for key in data if key.startswith("Rule")]
+        self.rules = [
+            {
+                "inputs": data[key]["inputs"],
+                "output_variable": data[key]["output_variable"],
+                "output_term": data[key]["output_term"]
+            }
+            for key in self.rule_ids
+        ]
+
+        # === Termini di input (array di parametri piatti) ===
+        self.input_names = []
+        self.input_domains = []
+        self.input_terms = []
+        self.term_index = {}
+        self.term_types = []
+        self.term_defs = []
+        term_var = []
+        term_params = []
+
+        for var_name, variable in (data.get("input") or {}).items():
+            var_idx = len(self.input_names)
+            self.input_names.append(var_name)
+            self.input_domains.append(variable["domain"])
+            self.input_terms.append(variable["terms"])
+            for term in variable["terms"]:
+                if term.get("function_type") not in membership.FUNCTION_TYPES:
+                    continue
+                p = term.get("params") or {}
+                self.term_index[(var_name, term["term_name"])] = len(self.term_types)
+                self.term_types.append(term["function_type"])
+                self.term_defs.append(term)
+                term_var.append(var_idx)
+                if "mean" in p:
+                    term_params.append([p["mean"], p["sigma"], 0.0, 0.0])
+                else:
+                    term_params.append([p.get("a", 0.0), p.get("b", 0.0), p.get("c", 0.0), p.get("d", p.get("c", 0.0))])
+
+        self.input_domains = np.array(self.input_domains, dtype=float).reshape(-1, 2)
+        self.term_var = np.array(term_var, dtype=np.intp)
+        self.term_params = np.array(term_params, dtype=float).reshape(-1, 4)
+        self.n_terms = len(self.term_types)
+
+        # Colonne aggiuntive del vettore di membership: ZERO per i termini
+        # sconosciuti o non fuzzificati, ONE per il riempimento degli antecedenti
+        self.ZERO = self.n_terms
+        self.ONE = self.n_terms + 1
+
+        # === Regole come matrici di indici (regola x antecedente -> id termine) ===
+        n_antecedents = max((len(rule["inputs"]) for rule in self.rules), default=0)
+        self.rule_antecedents = np.full((len(self.rules), n_antecedents), self.ONE, dtype=np.intp)
+        for r, rule in enumerate(self.rules):
+            for k, cond in enumerate(rule["inputs"]):
+                key = (cond["input_variable"], cond["input_term"])
+                self.rule_antecedents[r, k] = self.term_index.get(key, self.ZERO)
+
+        # === Indice invertito (coppia di termini) -> regole ===
+        # Ogni regola è indicizzata sui suoi due antecedenti più selettivi (supporto più stretto
+        # rispetto al dominio): per un campione si valutano solo le regole la cui coppia indice
+        # ha membership non nulla, la min sugli altri antecedenti fa il resto.
+        # ZERO non è mai attivo, ONE (riempimento) lo è sempre.
+        selectivity = np.append(self._term_support(), [0.0, 2.0])
+        width = self.n_terms + 2
+        rows = np.arange(len(self.rules))
+        if n_antecedents:
+            ranked = np.argsort(selectivity[self.rule_antecedents], axis=1, kind="stable")
+            first = self.rule_antecedents[rows, ranked[:, 0]]
+            second = self.rule_antecedents[rows, ranked[:, 1]] if n_antecedents > 1 else np.full(len(rows), self.ONE)
+        else:
+            first = second = np.full(len(rows), self.ONE, dtype=np.intp)
+        keys = first * width + second
+        order = np.argsort(keys, kind="stable")
+        self.pair_rules = order.astype(np.intp)
+        self.pair_keys, starts = np.unique(keys[order], return_index=True)
+        self.pair_ptr = np.append(starts, len(order)).astype(np.intp)
+
+        self.settings = data.get("settings") or {}
+
+        # === Variabili di output con le curve già campionate ===
+        self.outputs = {}
+        for var_name, variable in (data.get("output") or {}).items():
+            terms = variable["terms"]
+            is_classification = bool(terms) and terms[0].get("function_type") == "Classification"
+            is_sugeno = bool(terms) and all(term.get("function_type") == "Sugeno" for term in terms)
+            output = {
+                "domain": variable.get("domain"),
+                "terms": terms,
+                "term_names": [term["term_name"] for term in terms],
+                "is_classification": is_classification,
+                "is_sugeno": is_sugeno
+            }
+            if is_sugeno:
+                # Conseguenti TSK: costante + coefficienti allineati a input_names (zero per gli input assenti)
+                output["method"] = "weighted_average"
+                output["constants"], output["coefficients"] = self._sugeno_consequents(terms)
+                output["resolution"] = {"points": None, "mode": "sugeno", "estimated_error": 0.0}
+            elif not is_classification:
+                domain_min, domain_max = variable["domain"]
+                options = self.settings.get("resolution") or {}
+                # L'integrazione esatta si usa solo se costa meno della griglia configurata
+                grid_points = (options.get("variables") or {}).get(var_name) or options.get("points", OUTPUT_RESOLUTION)
+                output["centroid"] = ExactCentroid(terms, variable["domain"], grid_points)
+                output["method"] = output_method(terms)
+                output["resolution"] = choose_resolution(
+                    var_name, terms, variable["domain"], output["method"], output["centroid"], options
+                )
+                points = output["resolution"]["points"] or OUTPUT_RESOLUTION
+                output["x"] = np.linspace(domain_min, domain_max, points)
+                curves = [output_curve(var_name, term, variable["domain"], points) for term in terms]
+                output["y"] = np.array(curves).reshape(len(terms), points)
+            self.outputs[var_name] = output
+
+        self.rule_output_term = np.array([
+            self._output_term_position(rule["output_variable"], rule["output_term"])
+            for rule in self.rules
+        ], dtype=np.intp)
+
+        # Per ogni variabile di output: regole ordinate per conseguente (per la
+        # riduzione max a gruppi) e ordine di prima comparsa dei termini (usato
+        # per gli spareggi in Classification)
+        for var_name, output in self.outputs.items():
+            rule_idx = np.array([r for r, rule in enumerate(self.rules)
+                                 if rule["output_variable"] == var_name and self.rule_output_term[r] >= 0],
+                                dtype=np.intp)
+            rule_terms = self.rule_output_term[rule_idx]
+            order = np.argsort(rule_terms, kind="stable")
+            sorted_terms = rule_terms[order]
+            starts = np.flatnonzero(np.r_[True, sorted_terms[1:] != sorted_terms[:-1]]) if len(order) else order
+
+            output["rule_idx"] = rule_idx
+            output["rules_by_term"] = rule_idx[order]
+            output["group_starts"] = starts
+            output["group_terms"] = sorted_terms[starts]
+            output["term_order"] = np.array(list(dict.fromkeys(rule_terms.tolist())), dtype=np.intp)
+        self.active_outputs = [name for name, output in self.outputs.items() if len(output["rule_idx"])]
+
+        # === Modalità tabulata (opzionale, dalle impostazioni della sessione) ===
+        self.lookup = None
+        self.lookup_error = None
+        tabulated = self.settings.get("tabulated") or {}
+        if tabulated.get("enabled"):
+            try:
+                points = int(tabulated.get("grid_points", LOOKUP_GRID_POINTS))
+                self.lookup = LookupTable.for_model(self, lambda X: batch_infer(self, X), points)
+            except ValueError as e:
+                self.lookup_error = str(e)
+
+    def class_outputs(self):
+        """Variabili di output Classification che hanno almeno una regola."""
+        return [name for name in self.active_outputs if self.outputs[name]["is_classification"]]
+
+    def resolution_info(self):
+        """Risoluzione ed errore stimato degli output attivi; per le griglie fisse l'errore è calcolato alla prima richiesta."""
+        info = {}
+        for var_name in self.active_outputs:
+            output = self.outputs[var_name]
+            resolution = output.get("resolution")
+            if resolution is None:
+                continue
+            if "estimated_error" not in resolution:
+                resolution["estimated_error"] = resolution_error(
+                    var_name, output["terms"], output["domain"], output["method"], resolution["points"]
+                )
+            info[var_name] = resolution
+        return info
+
+    def lookup_info(self):
+        """Stato della modalità tabulata per le risposte delle API; None se non richiesta."""
+        if self.lookup is not None:
+            return {"enabled": True, **self.lookup.info()}
+        if self.lookup_error:
+            return {"enabled": False, "error": self.lookup_error}
+        return None
+
+    def _term_support(self):
+        """Frazione del dominio in cui ciascun termine di input ha membership non nulla (1 per le gaussiane)."""
+        support = np.ones(self.n_terms)
+        if not self.n_terms:
+            return support
+        lo, hi = self.input_domains[self.term_var].T
+        linear = np.array([not t.startswith("Gaussian") for t in self.term_types])
+        left = np.fmax(self.term_params[:, 0], lo)
+        right = np.fmin(self.term_params[:, 3], hi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.clip((right - left) / (hi - lo), 0.0, 1.0)
+        support[linear] = np.nan_to_num(fraction[linear], nan=1.0)
+        return support
+
+    def _sugeno_consequents(self, terms):
+        """Vettore delle costanti e matrice dei coefficienti (termini x input) dei conseguenti Sugeno."""
+        input_position = {name: i for i, name in enumerate(self.input_names)}
+        constants = np.zeros(len(terms))
+        coefficients = np.zeros((len(terms), len(self.input_names)))
+        for t, term in enumerate(terms):
+            params = term.get("params") or {}
+            constants[t] = float(params.get("constant", 0.0))
+            for input_name, coefficient in (params.get("coefficients") or {}).items():
+                if input_name in input_position:
+                    coefficients[t, input_position[input_name]] = float(coefficient)
+        return constants, coefficients
+
+    def _output_term_position(self, var_name, term_name):
+        output = self.outputs.get(var_name)
+        if output is None or term_name not in output["term_names"]:
+            return -1
+        return output["term_names"].index(term_name)
+
+    def membership_vector(self, fuzzified):
+        """Converte il dizionario prodotto da fuzzify_input in una riga della matrice di membership."""
+        memberships = np.zeros((1, self.n_terms + 2))
+        memberships[0, self.ONE] = 1.0
+        for (var_name, term_name), t in self.term_index.items():
+            memberships[0, t] = fuzzified.get(var_name, {}).get(term_name, 0)
+        return memberships
+
+    def fuzzify_batch(self, X):
+        """Calcola la matrice di membership (campioni x termini) per una matrice di input; NaN = input assente."""
+        n_samples = X.shape[0]
+        memberships = np.zeros((n_samples, self.n_terms + 2))
+        memberships[:, self.ONE] = 1.0
+        clipped = np.clip(X, self.input_domains[:, 0], self.input_domains[:, 1])
+        for t, term in enumerate(self.term_defs):
+            var_idx = self.term_var[t]
+            memberships[:, t] = membership.evaluate_term(term, clipped[:, var_idx], self.input_domains[var_idx])
+        missing = np.isnan(X[:, self.term_var])
+        memberships[:, :self.n_terms][missing] = 0.0
+        return memberships
+
+    def rule_strengths(self, memberships):
+        """Forza di attivazione di tutte le regole (campioni x regole) con congiunzione min.
+
+        Tramite l'indice invertito si valutano solo le regole candidate di ciascun campione;
+        se le candidate sono troppe (ingressi molto sovrapposti) si usa direttamente la gather densa.
+        """
+        n_samples, n_rules = memberships.shape[0], len(self.rules)
+        if self.rule_antecedents.shape[1] == 0:
+            return np.ones((n_samples, n_rules))
+
+        # Sui blocchi grandi si decide prima su un campione di righe, per non pagare due volte
+        probe = memberships[:SPARSE_PROBE_ROWS]
+        if n_samples > 4 * SPARSE_PROBE_ROWS and self._candidate_rules(probe) is None:
+            return self._dense_strengths(memberships)
+
+        candidates = self._candidate_rules(memberships)
+        if candidates is None:
+            return self._dense_strengths(memberships)
+        sample_ids, rule_ids = candidates
+
+        # Indici piatti: molto più rapidi della fancy indexing a due dimensioni
+        width = memberships.shape[1]
+        values = memberships.ravel()[(sample_ids * width)[:, None] + self.rule_antecedents[rule_ids]].min(axis=1)
+        strengths = np.zeros((n_samples, n_rules))
+        strengths.ravel()[sample_ids * n_rules + rule_ids] = values
+        return strengths
+
+    def _dense_strengths(self, memberships):
+        """Min sugli antecedenti di tutte le regole, una colonna di antecedenti alla volta.
+
+        Si lavora sulla trasposta (termini x campioni) così ogni gather copia righe contigue
+        e non si crea il tensore campioni x regole x antecedenti.
+        """
+        by_term = np.ascontiguousarray(memberships.T)
+        strengths = by_term[self.rule_antecedents[:, 0]]
+        for k in range(1, self.rule_antecedents.shape[1]):
+            np.minimum(strengths, by_term[self.rule_antecedents[:, k]], out=strengths)
+        return strengths.T
+
+    def _candidate_rules(self, memberships):
+        """Coppie (campione, regola) la cui coppia di antecedenti indice è attiva; None se conviene la via densa."""
+        n_samples, width = memberships.shape
+        dense_cost = n_samples * len(self.rules) * self.rule_antecedents.shape[1]
+
+        # Coppie ordinate di termini attivi nello stesso campione (np.nonzero è ordinato per riga)
+        samples, terms = np.nonzero(memberships > 0)
+        per_sample = np.bincount(samples, minlength=n_samples)
+        reps = per_sample[samples]
+        n_pairs = int(reps.sum())
+        if n_pairs > SPARSE_RULE_FRACTION * dense_cost:
+            return None
+        left = np.repeat(np.arange(len(terms)), reps)
+        sample_start = np.cumsum(per_sample) - per_sample
+        right = np.repeat(sample_start[samples] - (np.cumsum(reps) - reps), reps) + np.arange(n_pairs)
+        keys = terms[left] * width + terms[right]
+
+        slots = np.searchsorted(self.pair_keys, keys)
+        slots[slots == len(self.pair_keys)] = 0
+        hit = self.pair_keys[slots] == keys if len(self.pair_keys) else np.zeros(n_pairs, dtype=bool)
+        slots, pair_samples = slots[hit], samples[left[hit]]
+
+        # Espansione (campione, coppia attiva) -> (campione, regola candidata)
+        counts = self.pair_ptr[slots + 1] - self.pair_ptr[slots]
+        total = int(counts.sum())
+        if total * self.rule_antecedents.shape[1] > SPARSE_RULE_FRACTION * dense_cost:
+            return None
+        positions = np.repeat(self.pair_ptr[slots] - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        return np.repeat(pair_samples, counts), self.pair_rules[positions]
+
+    def term_activations(self, strengths, var_name):
+        """Attivazione di ciascun termine di output (campioni x termini) come max sulle regole che lo concludono.
+
+        Le regole sono già ordinate per termine conseguente, quindi lo scatter regola -> termine
+        è una sola riduzione a gruppi: per le Classification il risultato è il vettore dei
+        punteggi di classe. Per le variabili Sugeno le attivazioni si sommano: la media
+        pesata conta ogni regola.
+        """
+        output = self.outputs[var_name]
+        activations = np.zeros((strengths.shape[0], len(output["term_names"])))
+        reduce = np.add if output["is_sugeno"] else np.maximum
+        if len(output["rules_by_term"]):
+            activations[:, output["group_terms"]] = reduce.reduceat(
+                strengths[:, output["rules_by_term"]], output["group_starts"], axis=1
+            )
+        return activations
+
+    def defuzzify_batch(self, activations, var_name, class_index=False, X=None):
+        """Aggrega (max-min) e defuzzifica un blocco di campioni con il metodo salvato sulla variabile.
+
+        Per le variabili Classification restituisce le etichette vincenti, oppure la loro
+        posizione fra i termini se class_index è True. Per le variabili Sugeno serve X, la
+        matrice degli input del blocco, per valutare i conseguenti lineari.
+        """
+        output = self.outputs[var_name]
+
+        if output["is_sugeno"]:
+            return self._sugeno_output(activations, output, X)
+
+        if output["is_classification"]:
+            order = output["term_order"]
+            winners = order[activations[:, order].argmax(axis=1)]
+            if class_index:
+                return winners.astype(float)
+            return np.array(output["term_names"], dtype=object)[winners]
+
+        # Centroide: integrazione esatta quando possibile, altrimenti campionamento sulla griglia
+        if output["method"] == "centroid" and output["centroid"].supported:
+            return output["centroid"](activations)
+
+        aggregated = np.fmin(activations[:, :, None], output["y"][None, :, :]).max(axis=1, initial=0.0)
+        return defuzzify_batch(output["x"], aggregated, output["method"])
+
+    def _sugeno_output(self, activations, output, X):
+        """Media dei conseguenti z = c + a·x pesata con le attivazioni (0 se nessuna regola scatta).
+
+        Un input mancante non contribuisce ai conseguenti lineari.
+        """
+        consequents = np.broadcast_to(output["constants"], activations.shape)
+        if output["coefficients"].any():
+            if X is None:
+                raise ValueError("Sugeno outputs with linear consequents need the input values")
+            X = np.nan_to_num(np.asarray(X, dtype=float).reshape(-1, len(self.input_names)), nan=0.0)
+            consequents = consequents + X @ output["coefficients"].T
+        total = activations.sum(axis=1)
+        weighted = (activations * consequents).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(total > 0, weighted / total, 0.0)
+
+    def _sample_costs(self):
+        """Elementi temporanei per campione: valutazione delle regole e defuzzificazione di ogni output."""
+        outputs = []
+        for output in self.outputs.values():
+            if "centroid" not in output:
+                continue
+            if output["method"] == "centroid" and output["centroid"].supported:
+                outputs.append(output["centroid"].work_per_sample)
+            else:
+                outputs.append(len(output["term_names"]) * len(output["x"]))
+        return len(self.rules) * max(self.rule_antecedents.shape[1], 1), max(outputs, default=1)
+
+    def batch_rows(self):
+        """Numero di campioni per blocco, in modo da limitare la memoria temporanea."""
+        return max(1, BATCH_BUDGET // max(*self._sample_costs(), 1))
+
+    def sample_cost(self):
+        """Stima (per eccesso) del lavoro di inferenza per campione, in elementi elaborati."""
+        return max(1, sum(self._sample_costs()))
+
+
+def batch_infer(model, X, class_index=False, with_scores=False):
+    """Esegue l'inferenza vettorizzata su una matrice di input (campioni x variabili di input del modello).
+
+    X può essere anche un array mappato in memoria: viene convertito in float un blocco alla volta.
+    Con with_scores restituisce anche, per ogni output Classification, la matrice dei punteggi
+    (campioni x classi, nell'ordine dei termini) calcolata nello stesso passaggio.
+    """
+    if not isinstance(X, np.ndarray):
+        X = np.asarray(X, dtype=float)
+    X = X.reshape(-1, len(model.input_names))
+    results = {var_name: [] for var_name in model.active_outputs}
+    scores = {var_name: [] for var_name in model.class_outputs()} if with_scores else None
+    rows = model.batch_rows()
+
+    for start in range(0, X.shape[0], rows):
+        block = np.asarray(X[start:start + rows], dtype=float)
+        if model.lookup is not None:
+            block_results = _lookup_block(model, block)
+        else:
+            block_results = _infer_block(model, block, class_index, scores)
+        for var_name in model.active_outputs:
+            results[var_name].append(block_results[var_name])
+
+    results = {
+        var_name: np.concatenate(chunks) if chunks else np.zeros(0)
+        for var_name, chunks in results.items()
+    }
+    if not with_scores:
+        return results
+    scores = {
+        var_name: np.concatenate(chunks) if chunks else np.zeros((0, len(model.outputs[var_name]["term_names"])))
+        for var_name, chunks in scores.items()
+    }
+    return results, scores
+
+
+def _infer_block(model, X, class_index=False, scores=None):
+    memberships = model.fuzzify_batch(X)
+    strengths = model.rule_strengths(memberships)
+    results = {}
+    for var_name in model.active_outputs:
+        activations = model.term_activations(strengths, var_name)
+        if scores is not None and var_name in scores:
+            scores[var_name].append(activations)
+        results[var_name] = model.defuzzify_batch(activations, var_name, class_index, X)
+    return results
+
+
+def _lookup_block(model, X):
+    """Risultati interpolati dalla tabella; le righe con input mancanti passano dal motore esatto."""
+    missing = np.isnan(X).any(axis=1)
+    if not missing.any():
+        return model.lookup.interpolate(X)
+
+    results = {var_name: np.empty(X.shape[0]) for var_name in model.active_outputs}
+    interpolated = model.lookup.interpolate(X[~missing])
+    exact = _infer_block(model, X[missing])
+    for var_name in model.active_outputs:
+        results[var_name][~missing] = interpolated[var_name]
+        results[var_name][missing] = exact[var_name]
+    return results
+
+
+def control_surface(model, x_var, y_var, nx, ny, fixed=None):
+    """Output su una griglia nx x ny di due input, con gli altri fissati (default: centro del dominio).
+
+    Restituisce (assi, valori fissati, {variabile: matrice ny x nx}); le variabili Classification
+    riportano l'indice della classe. Se il costo stimato supera SURFACE_BUDGET la griglia viene
+    ridotta in proporzione su entrambi gli assi (la dimensione effettiva è quella degli assi).
+    I risultati sono in cache per hash del modello e specifica di griglia.
+    """
+    position = {name: i for i, name in enumerate(model.input_names)}
+    for name in (x_var, y_var):
+        if name not in position:
+            raise ValueError(f"Unknown input variable: {name}")
+    if x_var == y_var:
+        raise ValueError("The two axes must be different input variables")
+
+    values = {name: float(np.mean(model.input_domains[i])) for name, i in position.items()}
+    for name, value in (fixed or {}).items():
+        if name in position and value is not None:
+            values[name] = float(value)
+    values.pop(x_var)
+    values.pop(y_var)
+
+    cost = nx * ny * model.sample_cost()
+    if cost > SURFACE_BUDGET:
+        scale = np.sqrt(SURFACE_BUDGET / cost)
+        nx, ny = max(2, int(nx * scale)), max(2, int(ny * scale))
+
+    key = (model.model_hash, x_var, y_var, nx, ny, tuple(sorted(values.items())))
+    with _SURFACE_LOCK:
+        cached = _SURFACE_CACHE.get(key)
+        if cached is not None:
+            _SURFACE_CACHE.move_to_end(key)
+            return cached
+
+    axes = {
+        x_var: np.linspace(*model.input_domains[position[x_var]], nx),
+        y_var: np.linspace(*model.input_domains[position[y_var]], ny)
+    }
+    X = np.empty((ny * nx, len(model.input_names)))
+    for name, value in values.items():
+        X[:, position[name]] = value
+    grid_x, grid_y = np.meshgrid(axes[x_var], axes[y_var])
+    X[:, position[x_var]] = grid_x.ravel()
+    X[:, position[y_var]] = grid_y.ravel()
+
+    z = {name: result.reshape(ny, nx) for name, result in batch_infer(model, X, class_index=True).items()}
+    surface = (axes, values, z)
+
+    with _SURFACE_LOCK:
+        _SURFACE_CACHE[key] = surface
+        while len(_SURFACE_CACHE) > SURFACE_CACHE_SIZE:
+            _SURFACE_CACHE.popitem(last=False)
+    return surface
+
+
+def choose_resolution(var_name, terms, domain, method, centroid, options):
+    """Sceglie la risoluzione della griglia di output.
+
+    Il centroide esatto non usa la griglia (points None, errore 0). Altrimenti vale, in ordine:
+    la risoluzione impostata per la variabile, la modalità adattiva (la griglia più piccola con
+    errore stimato entro 'tolerance', partendo dalla larghezza dei termini più stretti), la
+    risoluzione globale 'points'. Solo la modalità adattiva stima l'errore in compilazione;
+    per le altre lo calcola resolution_error quando viene richiesto.
+    """
+    if method == "centroid" and centroid.supported:
+        return {"points": None, "mode": "exact", "estimated_error": 0.0}
+
+    fixed = (options.get("variables") or {}).get(var_name)
+    if fixed is None and options.get("adaptive"):
+        error = _resolution_estimator(var_name, terms, domain, method)
+        tolerance = float(options.get("tolerance", 1e-3 * (domain[1] - domain[0])))
+        points = _initial_resolution(terms, domain)
+        estimate = error(points)
+        while estimate > tolerance and points < MAX_RESOLUTION:
+            points = min(MAX_RESOLUTION, 2 * points)
+            estimate = error(points)
+        return {"points": points, "mode": "adaptive", "estimated_error": estimate, "tolerance": tolerance}
+
+    return {"points": int(fixed if fixed is not None else options.get("points", OUTPUT_RESOLUTION)), "mode": "fixed"}
+
+
+def resolution_error(var_name, terms, domain, method, points):
+    """Errore massimo stimato della defuzzificazione su points campioni rispetto alla griglia di riferimento."""
+    return _resolution_estimator(var_name, terms, domain, method)(points)
+
+
+def _resolution_estimator(var_name, terms, domain, method):
+    """Funzione points -> errore stimato, con attivazioni di prova e riferimento calcolati una sola volta."""
+    probe = _probe_activations(len(terms))
+    reference = _grid_defuzzify(var_name, terms, domain, method, REFERENCE_RESOLUTION, probe)
+
+    def error(points):
+        values = _grid_defuzzify(var_name, terms, domain, method, points, probe)
+        return float(np.max(np.abs(values - reference), initial=0.0))
+
+    return error
+
+
+def _initial_resolution(terms, domain):
+    """Punti necessari per avere almeno 4 campioni sul lato più stretto di un termine."""
+    width = domain[1] - domain[0]
+    sides = []
+    for term in terms:
+        p = term.get("params") or {}
+        if term.get("function_type") == "Triangolare":
+            sides += [p["b"] - p["a"], p["c"] - p["b"]]
+        elif term.get("function_type") == "Trapezoidale":
+            sides += [p["b"] - p["a"], p["d"] - p["c"]]
+        elif term.get("function_type") == "Gaussian":
+            sides.append(p["sigma"])
+    sides = [side for side in sides if side > 0]
+    if not sides or width <= 0:
+        return MIN_RESOLUTION
+    return int(np.clip(np.ceil(4 * width / min(sides)) + 1, MIN_RESOLUTION, MAX_RESOLUTION))
+
+
+def _probe_activations(n_terms):
+    """Attivazioni casuali fisse (circa un terzo dei termini spenti) per stimare l'errore della griglia."""
+    activations = np.random.default_rng(0).uniform(0.0, 1.0, size=(PROBE_SAMPLES, n_terms))
+    activations[activations < 0.3] = 0.0
+    return activations
+
+
+def _grid_defuzzify(var_name, terms, domain, method, points, activations):
+    x = np.linspace(domain[0], domain[1], points)
+    aggregated = np.zeros((activations.shape[0], points))
+    for j, term in enumerate(terms):
+        y = output_curve(var_name, term, domain, points) if points <= MAX_RESOLUTION else compute_membership_y(term, x)
+        np.maximum(aggregated, np.fmin(activations[:, j:j + 1], y), out=aggregated)
+    return defuzzify_batch(x, aggregated, method)
+
+
+def output_curve(var_name, term, domain, resolution):
+    """Curva campionata (array float in sola lettura) di un termine di output, riusata tramite cache LRU."""
+    key = (
+        var_name,
+        term.get("function_type"),
+        json.dumps(term.get("params") or {}, sort_keys=True),
+        tuple(domain),
+        resolution
+    )
+    with _CURVE_LOCK:
+        y = _CURVE_CACHE.get(key)
+        if y is not None:
+            _CURVE_CACHE.move_to_end(key)
+            return y
+
+    x = np.linspace(domain[0], domain[1], resolution)
+    y = np.asarray(compute_membership_y(term, x), dtype=float)
+    y.flags.writeable = False
+
+    with _CURVE_LOCK:
+        _CURVE_CACHE[key] = y
+        while len(_CURVE_CACHE) > CURVE_CACHE_SIZE:
+            _CURVE_CACHE.popitem(last=False)
+    return y
+
+
+def compute_membership_y(term, x):
+    """Campiona la funzione di appartenenza di un termine di output sulla griglia x."""
+    if term.get("function_type") not in ("Triangolare", "Trapezoidale", "Gaussian"):
+        return np.zeros_like(x)
+    return membership.evaluate_term(term, x)
+
+
+def get_model():
+    """Restituisce il modello compilato della sessione corrente, compilandolo solo se necessario.
+
+    La cache è indicizzata sulla versione persistita del modello, quindi resta coerente anche
+    con più processi worker che scrivono la stessa sessione; i dati letti dallo store di
+    file_handler cambiano oggetto anche per scritture esterne non versionate.
+    """
+    session_id = get_session_id()
+    data = load_terms(readonly=True)
+    version = data.get(VERSION_KEY, 0)
+
+    with _MODEL_LOCK:
+        entry = _MODEL_CACHE.get(session_id)
+        if entry and entry["version"] == version and entry["model"].data is data:
+            _MODEL_CACHE.move_to_end(session_id)
+            return entry["model"]
+
+    model = FISModel(data)
+
+    with _MODEL_LOCK:
+        _MODEL_CACHE[session_id] = {"version": version, "model": model}
+        _MODEL_CACHE.move_to_end(session_id)
+        while len(_MODEL_CACHE) > MODEL_CACHE_SIZE:
+            _MODEL_CACHE.popitem(last=False)
+    return model
+
+
+def invalidate_model():
+    """Invalida il modello compilato della sessione corrente dopo una modifica."""
+    discard_model(get_session_id())
+
+
+def discard_model(session_id):
+    """Rimuove dalle cache di processo il modello e i risultati di una sessione (modificata o eliminata)."""
+    with _MODEL_LOCK:
+        _MODEL_CACHE.pop(session_id, None)
+    discard_session_results(session_id)
@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from flaskr.fis_model import batch_infer
+
+# Valori di default, sovrascrivibili con JOB_WORKERS / JOB_QUEUE_SIZE / JOB_CHUNK_ROWS nella config dell'app
+JOB_WORKERS = 2
+JOB_QUEUE_SIZE = 16
+JOB_CHUNK_ROWS = 10_000
+
+# Job conclusi conservati in memoria (i più vecchi vengono scartati)
+JOB_HISTORY = 100
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class QueueFull(Exception):
+    """La coda dei job è piena: il client deve riprovare più tardi."""
+
+
+class Job:
+    """Un'inferenza batch eseguita in background, con avanzamento e annullamento."""
+
+    def __init__(self, session_id, model, X, chunk_rows):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.model = model
+        self.X = X
+        self.chunk_rows = chunk_rows
+        self.total = int(X.shape[0])
+        self.processed = 0
+        self.status = QUEUED
+        self.error = None
+        self.results = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def run(self):
+        if self.cancel_event.is_set():
+            self._finish(CANCELLED)
+            return
+
+        self.status = RUNNING
+        self.started_at = time.time()
+        parts = []
+        try:
+            for start in range(0, self.total, self.chunk_rows):
+                if self.cancel_event.is_set():
+                    self._finish(CANCELLED)
+                    return
+                parts.append(batch_infer(self.model, self.X[start:start + self.chunk_rows]))
+                self.processed = min(self.total, start + self.chunk_rows)
+
+            self.results = {
+                var_name: np.concatenate([part[var_name] for part in parts]) if parts else np.zeros(0)
+                for var_name in self.model.active_outputs
+            }
+            self._finish(DONE)
+        except Exception as e:
+            print(f"Error during job {self.id}: {e}")
+            self.error = str(e)
+            self._finish(FAILED)
+
+    def _finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+        # Input e modello non servono più: si libera la memoria
+        self.X = None
+        self.model = None
+
+    def to_dict(self):
+        """Stato del job con avanzamento e throughput."""
+        now = self.finished_at or time.time()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        throughput = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.processed
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "progress": self.processed / self.total if self.total else 1.0,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(throughput, 1),
+            "eta_seconds": round(remaining / throughput, 3) if throughput and not self.finished else None,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """Pool di thread con coda limitata: se la coda è piena submit solleva QueueFull (backpressure)."""
+
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"fis-job-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                job.run()
+            finally:
+                self.queue.task_done()
+
+    def submit(self, session_id, model, X, chunk_rows=JOB_CHUNK_ROWS):
+        job = Job(session_id, model, X, max(1, int(chunk_rows)))
+        with self.lock:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull("Job queue is full, retry later")
+            self.jobs[job.id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id, session_id):
+        """Job della sessione indicata, None se non esiste (o appartiene a un'altra sessione)."""
+        job = self.jobs.get(job_id)
+        if job is None or job.session_id != session_id:
+            return None
+        return job
+
+    def cancel(self, job_id, session_id):
+        job = self.get(job_id, session_id)
+        if job is not None and not job.finished:
+            job.cancel_event.set()
+            # Un job ancora in coda viene segnato subito; quello in esecuzione si ferma al blocco successivo
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job.id]
+
+
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_job_manager(config):
+    """JobManager di processo, creato al primo uso con la configurazione dell'app."""
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            _MANAGER = JobManager(
+                workers=config.get("JOB_WORKERS", JOB_WORKERS),
+                queue_size=config.get("JOB_QUEUE_SIZE", JOB_QUEUE_SIZE)
+            )
+        return _MANAGER
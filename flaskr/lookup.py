@@ -0,0 +1,76 @@
+import itertools
+
+import numpy as np
+
+# Limiti della modalità tabulata
+LOOKUP_MAX_INPUTS = 3
+LOOKUP_GRID_POINTS = 33
+LOOKUP_MAX_CELLS = 2_000_000
+LOOKUP_VALIDATION_SAMPLES = 2000
+
+
+class LookupTable:
+    """Superficie di output precalcolata su una griglia regolare degli input, interrogata per interpolazione multilineare.
+
+    evaluate è una funzione matrice di input -> {variabile di output: array} (il motore esatto):
+    viene usata per riempire la griglia e per misurare l'errore massimo su punti di validazione.
+    """
+
+    def __init__(self, domains, output_names, evaluate, points=LOOKUP_GRID_POINTS,
+                 validation_samples=LOOKUP_VALIDATION_SAMPLES, seed=0):
+        self.domains = np.asarray(domains, dtype=float).reshape(-1, 2)
+        self.points = int(points)
+        self.output_names = list(output_names)
+        n_inputs = self.domains.shape[0]
+        self.shape = (self.points,) * n_inputs
+
+        axes = [np.linspace(lo, hi, self.points) for lo, hi in self.domains]
+        grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, n_inputs)
+        values = evaluate(grid)
+        self.tables = {name: np.asarray(values[name], dtype=float).ravel() for name in self.output_names}
+
+        # Errore massimo di interpolazione rispetto al motore esatto su punti casuali del dominio
+        rng = np.random.default_rng(seed)
+        X = rng.uniform(self.domains[:, 0], self.domains[:, 1], size=(validation_samples, n_inputs))
+        exact = evaluate(X)
+        approx = self.interpolate(X)
+        self.max_error = {
+            name: float(np.max(np.abs(approx[name] - np.asarray(exact[name], dtype=float)), initial=0.0))
+            for name in self.output_names
+        }
+
+    @classmethod
+    def for_model(cls, model, evaluate, points=LOOKUP_GRID_POINTS):
+        """Costruisce la tabella per un FISModel; ValueError se il modello non è tabulabile."""
+        n_inputs = len(model.input_names)
+        if not 1 <= n_inputs <= LOOKUP_MAX_INPUTS:
+            raise ValueError(f"Tabulated mode supports 1 to {LOOKUP_MAX_INPUTS} inputs, the system has {n_inputs}")
+        if any(model.outputs[name]["is_classification"] for name in model.active_outputs):
+            raise ValueError("Tabulated mode does not support Classification outputs")
+        if points < 2 or points ** n_inputs > LOOKUP_MAX_CELLS:
+            raise ValueError(f"grid_points must be at least 2 and give at most {LOOKUP_MAX_CELLS} grid cells")
+        return cls(model.input_domains, model.active_outputs, evaluate, points)
+
+    def interpolate(self, X):
+        """Interpolazione multilineare (input senza valori mancanti, limitati al dominio)."""
+        n_inputs = self.domains.shape[0]
+        X = np.asarray(X, dtype=float).reshape(-1, n_inputs)
+        lo, hi = self.domains[:, 0], self.domains[:, 1]
+        step = (hi - lo) / (self.points - 1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            position = np.where(step > 0, (np.clip(X, lo, hi) - lo) / step, 0.0)
+        base = np.clip(np.floor(position).astype(np.intp), 0, self.points - 2)
+        frac = position - base
+
+        results = {name: np.zeros(X.shape[0]) for name in self.output_names}
+        for corner in itertools.product((0, 1), repeat=n_inputs):
+            corner = np.array(corner, dtype=np.intp)
+            weight = np.prod(np.where(corner == 1, frac, 1.0 - frac), axis=1)
+            flat = np.ravel_multi_index(tuple((base + corner).T), self.shape)
+            for name, table in self.tables.items():
+                results[name] += weight * table[flat]
+        return results
+
+    def info(self):
+        return {"grid_points": self.points, "cells": int(np.prod(self.shape)), "max_error": self.max_error}
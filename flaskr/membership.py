@@ -0,0 +1,88 @@
+import numpy as np
+
+# Tipi di funzione di appartenenza gestiti dai kernel analitici
+FUNCTION_TYPES = (
+    "Triangolare", "Trapezoidale", "Gaussian",
+    "Triangolare-open", "Trapezoidale-open", "Gaussian-open"
+)
+
+
+def _as_array(x):
+    """Converte x in array float almeno 1-D, indicando se in origine era uno scalare."""
+    arr = np.asarray(x, dtype=float)
+    return np.atleast_1d(arr), arr.ndim == 0
+
+
+def _result(y, scalar):
+    return float(y[0]) if scalar else y
+
+
+def trimf(x, a, b, c):
+    """Funzione triangolare in forma chiusa (stessa semantica di skfuzzy.trimf)."""
+    x, scalar = _as_array(x)
+    y = np.zeros(x.shape)
+    if a != b:
+        idx = (a < x) & (x < b)
+        y[idx] = (x[idx] - a) / (b - a)
+    if b != c:
+        idx = (b < x) & (x < c)
+        y[idx] = (c - x[idx]) / (c - b)
+    y[x == b] = 1.0
+    return _result(y, scalar)
+
+
+def trapmf(x, a, b, c, d):
+    """Funzione trapezoidale in forma chiusa (stessa semantica di skfuzzy.trapmf)."""
+    x, scalar = _as_array(x)
+    y = np.ones(x.shape)
+    idx = x <= b
+    y[idx] = trimf(x[idx], a, b, b)
+    idx = x >= c
+    y[idx] = trimf(x[idx], c, c, d)
+    y[(x < a) | (x > d)] = 0.0
+    return _result(y, scalar)
+
+
+def gaussmf(x, mean, sigma):
+    """Funzione gaussiana in forma chiusa."""
+    x, scalar = _as_array(x)
+    y = np.exp(-((x - mean) ** 2) / (2.0 * sigma ** 2))
+    return _result(y, scalar)
+
+
+def evaluate(function_type, params, x, domain_min=None, domain_max=None):
+    """Valuta un termine nei punti x (scalare o array); None se il tipo non è gestito."""
+    p = params
+    x, scalar = _as_array(x)
+
+    if function_type in ("Triangolare", "Triangolare-open"):
+        y = trimf(x, p["a"], p["b"], p["c"])
+        if function_type == "Triangolare-open":
+            y[(x < p["a"]) | (x > p["c"])] = 0.0
+    elif function_type in ("Trapezoidale", "Trapezoidale-open"):
+        y = trapmf(x, p["a"], p["b"], p["c"], p["d"])
+        if function_type == "Trapezoidale-open":
+            y[(x < p["a"]) | (x > p["d"])] = 0.0
+    elif function_type in ("Gaussian", "Gaussian-open"):
+        y = gaussmf(x, p["mean"], p["sigma"])
+        if function_type == "Gaussian-open":
+            if domain_min is not None:
+                y[x < domain_min] = 0.0
+            if domain_max is not None:
+                y[x > domain_max] = 0.0
+    else:
+        return None
+
+    return _result(y, scalar)
+
+
+def evaluate_term(term, x, domain=None):
+    """Valuta un termine salvato (dict con function_type e params) nei punti x."""
+    domain_min, domain_max = domain if domain is not None else (None, None)
+    return evaluate(term.get("function_type"), term.get("params") or {}, x, domain_min, domain_max)
+
+
+def fuzzify_value(term, value, domain):
+    """Grado di appartenenza di un valore di input, limitato al dominio della variabile."""
+    domain_min, domain_max = domain
+    return evaluate_term(term, np.clip(value, domain_min, domain_max), domain)
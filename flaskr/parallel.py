@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import numpy as np
+
+from flaskr.fis_model import batch_infer
+
+# Campioni inviati a un processo per ogni blocco
+PARALLEL_CHUNK_ROWS = 50_000
+
+# Pool di processi tenuti vivi fra le richieste (uno per modello, numero di worker e contesto)
+POOL_CACHE_SIZE = 2
+
+# Modello compilato del processo worker, ricevuto una sola volta dall'initializer
+_WORKER_MODEL = None
+
+# (hash del modello, worker, start method) -> {"pool", "users", "evicted"}
+_POOLS = OrderedDict()
+_POOLS_LOCK = threading.Lock()
+
+
+def _init_worker(model):
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+
+
+def _score_chunk(X, class_index):
+    return batch_infer(_WORKER_MODEL, X, class_index)
+
+
+def max_workers():
+    return os.cpu_count() or 1
+
+
+@contextmanager
+def _model_pool(model, workers, mp_context=None):
+    """Pool di processi con il modello già caricato nei worker, riusato finché il modello non cambia.
+
+    Il modello viene serializzato solo alla creazione del pool. I pool meno usati di recente
+    oltre POOL_CACHE_SIZE vengono chiusi non appena nessuna richiesta li sta usando.
+    """
+    key = (model.model_hash, workers, mp_context.get_start_method() if mp_context else None)
+    idle = []
+    with _POOLS_LOCK:
+        entry = _POOLS.get(key)
+        if entry is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                       initializer=_init_worker, initargs=(model,))
+            entry = _POOLS[key] = {"pool": pool, "users": 0, "evicted": False}
+        _POOLS.move_to_end(key)
+        entry["users"] += 1
+        while len(_POOLS) > POOL_CACHE_SIZE:
+            _, old = _POOLS.popitem(last=False)
+            old["evicted"] = True
+            if old["users"] == 0:
+                idle.append(old["pool"])
+    for pool in idle:
+        pool.shutdown(wait=False)
+
+    broken = False
+    try:
+        yield entry["pool"]
+    except BrokenProcessPool:
+        broken = True
+        raise
+    finally:
+        with _POOLS_LOCK:
+            entry["users"] -= 1
+            if broken and _POOLS.get(key) is entry:
+                del _POOLS[key]
+                entry["evicted"] = True
+            close = entry["evicted"] and entry["users"] == 0
+        if close:
+            entry["pool"].shutdown(wait=False)
+
+
+def shutdown_pools():
+    """Chiude tutti i pool di processi tenuti in cache."""
+    with _POOLS_LOCK:
+        entries = list(_POOLS.values())
+        _POOLS.clear()
+        for entry in entries:
+            entry["evicted"] = True
+    for entry in entries:
+        if entry["users"] == 0:
+            entry["pool"].shutdown(wait=False)
+
+
+def parallel_batch_infer(model, X, workers=None, chunk_rows=PARALLEL_CHUNK_ROWS, class_index=False, mp_context=None):
+    """Come batch_infer, ma distribuisce blocchi di campioni su un pool di processi.
+
+    Il pool (e il modello nei worker) è riusato dalle chiamate successive sullo stesso modello;
+    i blocchi in volo sono al più due per worker e i risultati vengono riassemblati nell'ordine
+    originale. mp_context permette di scegliere lo start method (ad es. 'spawn').
+    """
+    if not isinstance(X, np.ndarray):
+        X = np.asarray(X, dtype=float)
+    X = X.reshape(-1, len(model.input_names))
+    chunk_rows = max(1, int(chunk_rows))
+    n_chunks = -(-X.shape[0] // chunk_rows)
+    workers = max(1, int(workers or max_workers()))
+
+    if workers <= 1 or n_chunks <= 1:
+        return batch_infer(model, X, class_index)
+
+    parts = []
+    pending = deque()
+    with _model_pool(model, workers, mp_context) as pool:
+        for start in range(0, X.shape[0], chunk_rows):
+            if len(pending) >= 2 * workers:
+                parts.append(pending.popleft().result())
+            chunk = np.asarray(X[start:start + chunk_rows], dtype=float)
+            pending.append(pool.submit(_score_chunk, chunk, class_index))
+        while pending:
+            parts.append(pending.popleft().result())
+
+    return {
+        var_name: np.concatenate([part[var_name] for part in parts])
+        for var_name in model.active_outputs
+    }
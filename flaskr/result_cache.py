@@ -0,0 +1,101 @@
+import math
+import threading
+from collections import OrderedDict
+
+# Valori di default, sovrascrivibili con INFER_CACHE_SIZE / INFER_CACHE_PRECISION nella config dell'app
+INFER_CACHE_SIZE = 1024
+INFER_CACHE_PRECISION = 6
+
+
+class ResultCache:
+    """Cache LRU delle risposte di /infer, indicizzata per (sessione, hash del modello, input arrotondati).
+
+    size 0 disattiva la cache; precision è il numero di decimali usati per confrontare gli input.
+    """
+
+    def __init__(self, size=INFER_CACHE_SIZE, precision=INFER_CACHE_PRECISION):
+        self.size = max(0, int(size))
+        self.precision = int(precision)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, session_id, model, inputs):
+        """Chiave della richiesta, None se gli input non sono confrontabili (valori non numerici)."""
+        if self.size == 0 or not isinstance(inputs, dict):
+            return None
+        values = []
+        for name in model.input_names:
+            value = inputs.get(name)
+            if value is None:
+                values.append(None)
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None
+            values.append(None if math.isnan(value) else round(value, self.precision))
+        return session_id, model.model_hash, tuple(values)
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard_session(self, session_id):
+        """Elimina i risultati della sessione (chiamata a ogni modifica del modello)."""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == session_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.size,
+                "precision": self.precision,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache(config):
+    """ResultCache di processo, creata al primo uso con la configurazione dell'app."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResultCache(
+                size=config.get("INFER_CACHE_SIZE", INFER_CACHE_SIZE),
+                precision=config.get("INFER_CACHE_PRECISION", INFER_CACHE_PRECISION)
+            )
+        return _CACHE
+
+
+def discard_session_results(session_id):
+    """Svuota i risultati della sessione, se la cache è già stata creata."""
+    if _CACHE is not None:
+        _CACHE.discard_session(session_id)
@@ -1,30 +1,191 @@
-from flask import Blueprint, request, jsonify, send_file, Response
-import os
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, current_app, g
+import io
+import csv
+import tempfile
+from contextlib import ExitStack
 from flaskr.file_handler import *
+from flaskr.storage import VERSION_KEY, RULE_COUNTER_KEY
+from flaskr.defuzzify import METHODS
+from flaskr.fis_model import get_model, invalidate_model, batch_infer, control_surface
+from flaskr.parallel import parallel_batch_infer, max_workers, PARALLEL_CHUNK_ROWS
+from flaskr.jobs import get_job_manager, QueueFull, DONE, JOB_CHUNK_ROWS
+from flaskr.result_cache import get_result_cache
+from flaskr import membership
 import logging
-import skfuzzy as fuzz
 import numpy as np
 import json
-import logging
-from datetime import datetime
 
 logging.basicConfig(level=logging.DEBUG)
 bp = Blueprint("api", __name__, url_prefix="/api")
 
+# Righe elaborate per blocco nello scoring in streaming
+STREAM_CHUNK_ROWS = 5000
+
+# Griglia della superficie di controllo (punti per asse)
+SURFACE_POINTS = 50
+SURFACE_MAX_POINTS = 200
+
+# Livelli di dettaglio della risposta di /infer (parametro 'verbosity', default 'full')
+INFER_VERBOSITY = ("results", "results+activations", "full")
+
+# Punti usati per disegnare le funzioni di appartenenza in /get_terms
+PLOT_POINTS = 100
+
+# Oltre questa dimensione il corpo binario viene copiato su un file temporaneo e mappato in memoria
+NPY_SPOOL_BYTES = 64 * 1024 * 1024
+
+# Endpoint che modificano la sessione: per tutta la richiesta tengono il lock esclusivo della
+# sessione (le altre richieste non lo prendono) e, se il client invia If-Match, vengono
+# rifiutati (412) quando la versione è cambiata dopo la lettura del client
+MUTATING_ENDPOINTS = {
+    "save", "create_term", "create_terms", "delete_term", "modify_term", "clear_output",
+    "create_rule", "create_rules", "delete_rule", "update_settings", "import_json"
+}
+
+# Endpoint la cui risposta riporta nell'ETag la versione della sessione (da rimandare in If-Match)
+VERSIONED_ENDPOINTS = MUTATING_ENDPOINTS | {"load"}
+
+# Numero massimo di termini o regole accettati da una singola richiesta bulk
+BULK_MAX_ITEMS = 50000
+
+
+#Validazione delle richieste
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_int(value, low, high):
+    return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+
+
+# Impostazioni di sessione accettate da PUT /settings (sezione -> chiave -> validatore)
+SETTINGS_SECTIONS = {
+    "tabulated": {
+        "enabled": lambda v: isinstance(v, bool),
+        "grid_points": lambda v: _is_int(v, 2, 1025)
+    },
+    "resolution": {
+        "points": lambda v: _is_int(v, 10, 20000),
+        "variables": lambda v: isinstance(v, dict) and all(_is_int(n, 10, 20000) for n in v.values()),
+        "adaptive": lambda v: isinstance(v, bool),
+        "tolerance": lambda v: _is_number(v) and v > 0,
+        "plot_points": lambda v: _is_int(v, 10, 5000)
+    }
+}
+
+
+def validate_settings(data):
+    """Controlla le sezioni note delle impostazioni; restituisce un messaggio di errore o None."""
+    for section, values in data.items():
+        if section not in SETTINGS_SECTIONS:
+            return f"Unknown settings section: {section}"
+        if not isinstance(values, dict):
+            return f"Settings section '{section}' must be a JSON object"
+        for key, value in values.items():
+            check = SETTINGS_SECTIONS[section].get(key)
+            if check is None:
+                return f"Unknown setting: {section}.{key}"
+            if not check(value):
+                return f"Invalid value for {section}.{key}"
+    return None
+
+
+def defuzzy_type_error(defuzzy_type):
+    """Controlla il metodo di defuzzificazione inviato con un termine di output; None se valido o assente."""
+    if not defuzzy_type:
+        return None
+    if not isinstance(defuzzy_type, str) or defuzzy_type.lower() not in METHODS:
+        return f"Unknown defuzzification method: {defuzzy_type}. Use one of: {', '.join(METHODS)}."
+    return None
+
+
+def sugeno_term_error(var_type, params, terms, function_type, term_name=None):
+    """Controlla un termine Sugeno (TSK) e la coerenza con gli altri termini della variabile.
+
+    Restituisce il messaggio d'errore, None se il termine è valido.
+    """
+    others = [t for t in terms if t.get("term_name") != term_name]
+    if others and any((t.get("function_type") == "Sugeno") != (function_type == "Sugeno") for t in others):
+        return "Sugeno terms cannot be mixed with other function types in the same variable."
+    if function_type != "Sugeno":
+        return None
+    if var_type != "output":
+        return "Sugeno terms are only allowed on output variables."
+    if not isinstance(params, dict) or not _is_number(params.get("constant")):
+        return "Sugeno terms need a numeric 'constant'."
+    coefficients = params.get("coefficients", {})
+    if not isinstance(coefficients, dict) or not all(_is_number(v) for v in coefficients.values()):
+        return "Sugeno 'coefficients' must map input variable names to numbers."
+    return None
+
+
+@bp.before_request
+def lock_session():
+    """Lock pessimistico sulle richieste che modificano la sessione, tenuto fino al teardown.
+
+    Le modifiche della stessa sessione vengono così eseguite una alla volta (lettura, controlli
+    e scrittura restano atomici); le letture, /infer* compresi, non prendono il lock e non
+    aspettano. If-Match, se presente, è controllato sotto il lock e rifiuta le modifiche basate
+    su una versione superata da un'altra scrittura.
+    """
+    if request.endpoint is None or request.endpoint.rsplit(".", 1)[-1] not in MUTATING_ENDPOINTS:
+        return None
+
+    g.session_lock = ExitStack()
+    g.session_lock.enter_context(session_lock())
+
+    version = session_version()
+    if request.if_match and not request.if_match.contains(str(version)):
+        g.session_version = version
+        return jsonify({
+            "error": "The session was modified by another request; reload it and retry.",
+            "version": version
+        }), 412
+    return None
+
+
+@bp.after_request
+def add_version_etag(response):
+    """ETag con la versione della sessione sulle risposte di /load e delle modifiche.
+
+    Usa la versione già nota alla richiesta (dati caricati, 412); dopo una modifica riuscita la
+    rilegge, ancora sotto il lock della sessione. Le altre risposte non toccano lo storage.
+    """
+    if request.endpoint is None or request.endpoint.rsplit(".", 1)[-1] not in VERSIONED_ENDPOINTS:
+        return response
+    version = g.get("session_version")
+    if version is None and response.status_code < 400:
+        version = session_version()
+    if version is not None and "ETag" not in response.headers:
+        response.set_etag(str(version))
+    return response
+
+
+@bp.teardown_request
+def unlock_session(exc):
+    stack = g.pop("session_lock", None)
+    if stack is not None:
+        stack.close()
+
+
 # Salva i dati dell'utente
 @bp.route("/save", methods=["POST"])
 def save():
     """Salva i dati inviati dal frontend come file di sessione."""  
     data = request.json
     save_data(data)
+    invalidate_model()
     return jsonify({"status": "success"})
 
 # Carica i dati dell'utente
 @bp.route("/load", methods=["GET"])
 def load():
     """Carica i dati di sessione dell’utente."""  
-    data = load_data()
-    return jsonify(data)
+    data = load_data(readonly=True)
+    # La versione viaggia solo nell'ETag; i campi interni dello storage non fanno parte della sessione
+    g.session_version = int(data.get(VERSION_KEY, 0))
+    return jsonify({key: value for key, value in data.items() if key not in (VERSION_KEY, RULE_COUNTER_KEY)})
 
 
 #Backend 
@@ -47,27 +208,18 @@ def create_term():
         if var_type not in ["input", "output"]:
             return jsonify({"error": "var_type deve essere 'input' o 'output'"}), 400
 
-        terms_data = load_terms()
-
-        # Inizializza il tipo di variabile se non esiste
-        if var_type not in terms_data:
-            terms_data[var_type] = {}
-
         if var_type == "output":
-            existing_variables = list(terms_data[var_type].keys())
+            existing_variables = variable_names(var_type)
             if existing_variables and variable_name not in existing_variables:
                 return jsonify({
                     "error": f"Only one variable can be entered {var_type}. It already exists {existing_variables[0]}'."
                 }), 400
 
-        # Se la variabile non esiste, creala
-        if variable_name not in terms_data[var_type]:
-            terms_data[var_type][variable_name] = {
-                "domain": [domain_min, domain_max],
-                "terms": []
-            }
-
-        variable_data = terms_data[var_type][variable_name]
+        # Se la variabile non esiste verrà creata insieme al termine
+        variable_data = get_variable(var_type, variable_name) or {
+            "domain": [domain_min, domain_max],
+            "terms": []
+        }
 
         if variable_data['domain'] != [domain_min, domain_max]:
             return jsonify({"error": "Inconsistent domain for the existing variable"}), 400
@@ -77,6 +229,13 @@ def create_term():
         if existing_term:
             return jsonify({"error": "The term already exists for this variable"}), 400
 
+        sugeno_error = sugeno_term_error(var_type, params, variable_data['terms'], function_type)
+        if sugeno_error:
+            return jsonify({"error": sugeno_error}), 400
+        method_error = defuzzy_type_error(defuzzy_type) if var_type == 'output' else None
+        if method_error:
+            return jsonify({"error": method_error}), 400
+
         new_term = {
             "term_name": term_name,
             "function_type": function_type,
@@ -84,11 +243,12 @@ def create_term():
         }
 
         if var_type == 'output' and defuzzy_type:
-            new_term['defuzzy_type'] = defuzzy_type
+            new_term['defuzzy_type'] = defuzzy_type.lower()
 
-        variable_data['terms'].append(new_term)
-
-        save_terms(terms_data)
+        store_term(var_type, variable_name, [domain_min, domain_max], new_term)
+        if var_type == 'output' and defuzzy_type:
+            apply_output_method(variable_name, variable_data['terms'], defuzzy_type.lower())
+        invalidate_model()
 
         return jsonify(new_term), 201
 
@@ -96,16 +256,129 @@ def create_term():
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
+@bp.route('/create_terms', methods=['POST'])
+def create_terms():
+    """Crea più termini fuzzy in un'unica richiesta: tutti validi e salvati con una sola scrittura, o nessuno."""
+    try:
+        data = request.get_json(silent=True)
+        items = data.get("terms") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "'terms' must be a non-empty list"}), 400
+        if len(items) > BULK_MAX_ITEMS:
+            return jsonify({"error": f"At most {BULK_MAX_ITEMS} terms per request"}), 400
+
+        entries, errors = validate_new_terms(load_terms(readonly=True), items)
+        if errors:
+            return jsonify({
+                "error": f"{len(errors)} invalid terms, nothing was created",
+                "errors": errors
+            }), 400
+
+        store_terms(entries)
+        invalidate_model()
+
+        return jsonify({
+            "message": f"{len(entries)} terms created successfully!",
+            "terms": [term for _, _, _, term in entries]
+        }), 201
+
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+
+def apply_output_method(variable_name, terms, method):
+    """Il metodo di defuzzificazione vale per tutta la variabile: lo riporta sugli altri termini che ne indicano un altro."""
+    for term in terms:
+        if term.get("defuzzy_type") and term["defuzzy_type"].lower() != method:
+            replace_term("output", variable_name, term["term_name"], {**term, "defuzzy_type": method})
+
+
+def validate_new_terms(terms_data, items):
+    """Valida i nuovi termini in un solo passaggio, rispetto alla sessione e agli altri termini della richiesta.
+
+    Restituisce (voci per store_terms, errori come [{"index", "error"}]).
+    """
+    variables = {}  # (tipo, nome) -> {"domain", "terms"} esistenti più quelli già accettati
+    output_names = list((terms_data.get("output") or {}).keys())
+    entries, errors = [], []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Each term must be a JSON object"})
+            continue
+        var_type = item.get('var_type')
+        variable_name = item.get('variable_name')
+        term_name = item.get('term_name')
+        domain = [item.get('domain_min'), item.get('domain_max')]
+        function_type = item.get('function_type')
+        params = item.get('params')
+
+        if var_type not in ["input", "output"]:
+            errors.append({"index": index, "error": "var_type deve essere 'input' o 'output'"})
+            continue
+        if not variable_name or not term_name:
+            errors.append({"index": index, "error": "variable_name and term_name are required"})
+            continue
+        if var_type == "output" and output_names and variable_name not in output_names:
+            errors.append({
+                "index": index,
+                "error": f"Only one variable can be entered {var_type}. It already exists {output_names[0]}'."
+            })
+            continue
+
+        key = (var_type, variable_name)
+        if key not in variables:
+            existing = (terms_data.get(var_type) or {}).get(variable_name)
+            variables[key] = {
+                "domain": existing["domain"] if existing else domain,
+                "terms": list(existing.get("terms", [])) if existing else [],
+            }
+            variables[key]["names"] = {t.get("term_name") for t in variables[key]["terms"]}
+        variable_data = variables[key]
+
+        if variable_data["domain"] != domain:
+            errors.append({"index": index, "error": "Inconsistent domain for the existing variable"})
+            continue
+        if term_name in variable_data["names"]:
+            errors.append({"index": index, "error": "The term already exists for this variable"})
+            continue
+        sugeno_error = sugeno_term_error(var_type, params, variable_data["terms"], function_type)
+        if sugeno_error:
+            errors.append({"index": index, "error": sugeno_error})
+            continue
+
+        new_term = {"term_name": term_name, "function_type": function_type, "params": params}
+        if var_type == 'output' and item.get('defuzzy_type'):
+            method_error = defuzzy_type_error(item['defuzzy_type'])
+            method = item['defuzzy_type'].lower() if not method_error else None
+            current = {(t.get("defuzzy_type") or "").lower() for t in variable_data["terms"]} - {"", method}
+            if method_error or current:
+                errors.append({"index": index, "error": method_error or (
+                    f"defuzzy_type '{method}' conflicts with '{current.pop()}' already set on {variable_name}")})
+                continue
+            new_term['defuzzy_type'] = method
+
+        variable_data["terms"].append(new_term)
+        variable_data["names"].add(term_name)
+        if var_type == "output" and variable_name not in output_names:
+            output_names.append(variable_name)
+        entries.append((var_type, variable_name, domain, new_term))
+
+    return entries, errors
+
+
 @bp.route('/get_terms', methods=['GET'])
 def get_terms():
     """Restituisce tutti i termini fuzzy con le coordinate x-y per calcolare il grafico."""  
     try:
-        terms_data = load_terms()
+        terms_data = load_terms(readonly=True)
 
         if not terms_data:
             return jsonify({"message": "No terms found"}), 404
 
         computed_terms = {"input": {}, "output": {}}
+        resolution = (terms_data.get("settings") or {}).get("resolution") or {}
+        plot_points = resolution.get("plot_points", PLOT_POINTS)
         
         for var_type in ["input", "output"]:
             variables = terms_data.get(var_type, {})
@@ -136,7 +409,7 @@ def get_terms():
                     continue
 
                 domain_min, domain_max = variable_data['domain']
-                x = np.linspace(domain_min, domain_max, 100)
+                x = np.linspace(domain_min, domain_max, plot_points)
                 computed_terms[var_type][variable_name] = {
                     "domain": [domain_min, domain_max],
                     "terms": []
@@ -145,22 +418,18 @@ def get_terms():
                 for term in terms:
                     term_name = term['term_name']
                     function_type = term['function_type']
-                    params = term['params']
-
-                    if function_type == 'Triangolare':
-                        y = fuzz.trimf(x, [params['a'], params['b'], params['c']])
-                    elif function_type == 'Gaussian':
-                        y = fuzz.gaussmf(x, params['mean'], params['sigma'])
-                    elif function_type == 'Trapezoidale':
-                        y = fuzz.trapmf(x, [params['a'], params['b'], params['c'], params['d']])
-                    elif function_type == 'Triangolare-open':
-                        y = open_trimf(x, params['a'], params['b'], params['c'])
-                    elif function_type == 'Gaussian-open':
-                        open_type = params.get('open_type', 'left')
-                        y = open_gaussmf(x, params['mean'], params['sigma'], domain_min, domain_max, open_type)
-                    elif function_type == 'Trapezoidale-open':
-                        y = open_trapmf(x, params['a'], params['b'], params['c'], params['d'])
-                    else:
+
+                    # Conseguente Sugeno: nessuna curva, solo i parametri (costante disegnata come singleton)
+                    if function_type == 'Sugeno':
+                        params = term.get('params') or {}
+                        sugeno_term = {"term_name": term_name, "function_type": function_type, "params": params}
+                        if not params.get('coefficients') and _is_number(params.get('constant')):
+                            sugeno_term.update(x=[params['constant']] * 2, y=[0, 1])
+                        computed_terms[var_type][variable_name]['terms'].append(sugeno_term)
+                        continue
+
+                    y = membership.evaluate_term(term, x, (domain_min, domain_max))
+                    if y is None:
                         continue
 
                     computed_terms[var_type][variable_name]['terms'].append({
@@ -176,43 +445,14 @@ def get_terms():
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
-    
-def open_trimf(x, a, b, c):
-    """Versione 'open' di una funzione triangolare: forza y=0 fuori da [a, c]."""  
-    y = fuzz.trimf(x, [a, b, c])
-    y[x < a] = 0
-    y[x > c] = 0
-    return y
-def open_gaussmf(x, mean, sigma, min_val, max_val, open_type):
-    """Versione 'open' di una gaussiana: forza y=0 alle estremità del dominio."""  
-    y = fuzz.gaussmf(x, mean, sigma)
-    
-    if open_type == 'left':
-        y[x < min_val] = 0  # Forza la coda sinistra a 0
-    elif open_type == 'right':
-        y[x > max_val] = 0  # Forza la coda destra a 0
-    
-    return y
-
-def open_trapmf(x, a, b, c, d):
-    """Versione 'open' di una trapezoidale: forza y=0 fuori da [a, d]."""  
-    y = fuzz.trapmf(x, [a, b, c, d])
-    y[x < a] = 0
-    y[x > d] = 0
-    return y
 
 @bp.route('/get_term/<variable_name>/<term_name>', methods=['GET'])
 def get_term(variable_name, term_name):
     """Restituisce i parametri di un singolo termine fuzzy."""  
     try:
-        terms_data = load_terms()
-        
-        for var_type, variables in terms_data.items():
-            if variable_name in variables:
-                variable_data = variables[variable_name]
-                term_to_get = next((t for t in variable_data['terms'] if t['term_name'] == term_name), None)
-                if term_to_get:
-                    return jsonify(term_to_get), 200
+        found = find_term(term_name, variable_name)
+        if found:
+            return jsonify(found[2]), 200
 
         return jsonify({"error": "No terms found."}), 404
 
@@ -223,15 +463,12 @@ def get_term(variable_name, term_name):
 def delete_term(term_name):
     """Elimina un termine fuzzy dal file in base al nome."""  
     try:
-        terms_data = load_terms()
-        
-        for var_type, variables in terms_data.items():
-            for variable_name, variable_data in variables.items():
-                term_to_delete = next((t for t in variable_data['terms'] if t['term_name'] == term_name), None)
-                if term_to_delete:
-                    variable_data['terms'].remove(term_to_delete)
-                    save_terms(terms_data)
-                    return jsonify({"message": "Term successfully deleted!"}), 200
+        found = find_term(term_name)
+        if found:
+            var_type, variable_name, _ = found
+            remove_term(var_type, variable_name, term_name)
+            invalidate_model()
+            return jsonify({"message": "Term successfully deleted!"}), 200
 
         return jsonify({"error": "No terms found."}), 404
 
@@ -308,13 +545,13 @@ def modify_term(old_term_name):
         elif function_type == 'Classification':
             pass  # Nessuna validazione sui parametri
 
-        # Carica i dati esistenti
-        terms_data = load_terms()
+        elif function_type == 'Sugeno':
+            pass  # Validata più sotto insieme agli altri termini della variabile
 
         # Trova la variabile
-        for var_type, variables in terms_data.items():
-            if variable_name in variables:
-                variable_data = variables[variable_name]
+        for var_type in ("input", "output"):
+            variable_data = get_variable(var_type, variable_name)
+            if variable_data is not None:
                 terms = variable_data.get("terms", [])
 
                 # Trova il termine da modificare
@@ -326,6 +563,13 @@ def modify_term(old_term_name):
                         if any(t['term_name'] == new_term_name for t in terms):
                             return jsonify({"error": f"The new term name '{new_term_name}' already exists."}), 400
 
+                    sugeno_error = sugeno_term_error(var_type, params, terms, function_type, old_term_name)
+                    if sugeno_error:
+                        return jsonify({"error": sugeno_error}), 400
+                    method_error = defuzzy_type_error(defuzzy_type) if var_type == 'output' else None
+                    if method_error:
+                        return jsonify({"error": method_error}), 400
+
                     # Modifica i dati
                     term_to_modify['term_name'] = new_term_name
                     term_to_modify['function_type'] = function_type
@@ -336,9 +580,12 @@ def modify_term(old_term_name):
                         if defuzzy_type is None and 'defuzzy_type' in term_to_modify:
                             del term_to_modify['defuzzy_type']
                         elif defuzzy_type:
-                            term_to_modify['defuzzy_type'] = defuzzy_type
+                            term_to_modify['defuzzy_type'] = defuzzy_type.lower()
 
-                    save_terms(terms_data)
+                    replace_term(var_type, variable_name, old_term_name, term_to_modify)
+                    if var_type == 'output' and defuzzy_type:
+                        apply_output_method(variable_name, terms, defuzzy_type.lower())
+                    invalidate_model()
                     return jsonify({"message": "Term successfully modified!", "term": term_to_modify}), 201
 
         return jsonify({"error": "No terms found."}), 404
@@ -366,6 +613,7 @@ def clear_output():
         for rule_key in rules_to_delete:
             del data[rule_key]
         save_data(data)
+        invalidate_model()
         
         return jsonify({"message": "Output section and associated rules successfully removed."}), 200
     except Exception as e:
@@ -379,7 +627,7 @@ def clear_output():
 def get_variables_and_terms():
     """Restituisce variabili input/output e i relativi termini per la creazione delle regole."""  
     try:
-        terms_data = load_rule()
+        terms_data = load_rule(readonly=True)
         if not terms_data or not isinstance(terms_data, dict):
             return jsonify({"error": "No variables found"}), 404
 
@@ -403,7 +651,7 @@ def get_variables_and_terms():
 def get_rules():
     """Restituisce tutte le regole fuzzy salvate."""  
     try:
-        rules_data = load_rule()
+        rules_data = load_rule(readonly=True)
 
         if not rules_data or not isinstance(rules_data, dict):
             return jsonify([]), 200  
@@ -439,38 +687,124 @@ def create_rule():
         if not all([inputs, output_variable, output_term]):
             return jsonify({"error": "Incomplete data"}), 400
 
-        # Carica le regole esistenti
-        rules_data = load_rule()
-
-        # Genera un nuovo ID per la regola
-        rule_ids = [int(key.replace("Rule", "")) for key in rules_data.keys() if key.startswith("Rule")]
-        next_rule_id = max(rule_ids) + 1 if rule_ids else 0
-        rule_id = f"Rule{next_rule_id}"
-
-        # Aggiungi la nuova regola
-        rules_data[rule_id] = {
+        # Genera un nuovo ID per la regola e la salva
+        rule_id = next_rule_id()
+        store_rule(rule_id, {
             "inputs": inputs,
             "output_variable": output_variable,
             "output_term": output_term
-        }
-
-        # Salva le regole aggiornate
-        save_terms(rules_data)
+        })
+        invalidate_model()
 
         return jsonify({"message": "Rule created successfully!", "rule_id": rule_id}), 201
 
     except Exception as e:
         return jsonify({"error": f" {str(e)}"}), 500
     
+@bp.route('create_rules', methods=['POST'])
+def create_rules():
+    """Crea più regole fuzzy in un'unica richiesta: id consecutivi dal contatore e una sola scrittura."""
+    try:
+        data = request.get_json(silent=True)
+        items = data.get("rules") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "'rules' must be a non-empty list"}), 400
+        if len(items) > BULK_MAX_ITEMS:
+            return jsonify({"error": f"At most {BULK_MAX_ITEMS} rules per request"}), 400
+
+        rules, errors = validate_new_rules(load_rule(readonly=True), items)
+        if errors:
+            return jsonify({
+                "error": f"{len(errors)} invalid rules, nothing was created",
+                "errors": errors
+            }), 400
+
+        rule_ids = store_rules(rules)
+        invalidate_model()
+
+        return jsonify({
+            "message": f"{len(rule_ids)} rules created successfully!",
+            "rule_ids": rule_ids
+        }), 201
+
+    except Exception as e:
+        return jsonify({"error": f" {str(e)}"}), 500
+
+
+def _rule_signature(inputs, output_variable, output_term):
+    return (frozenset((c.get("input_variable"), c.get("input_term")) for c in inputs), output_variable, output_term)
+
+
+def validate_new_rules(rules_data, items):
+    """Valida le nuove regole in un solo passaggio rispetto alle variabili e ai termini della sessione.
+
+    Scarta anche le regole già presenti (nella sessione o ripetute nella richiesta).
+    Restituisce (regole per store_rules, errori come [{"index", "error"}]).
+    """
+    terms = {
+        var_type: {name: {t.get("term_name") for t in variable.get("terms", [])}
+                   for name, variable in (rules_data.get(var_type) or {}).items()}
+        for var_type in ("input", "output")
+    }
+    seen = {
+        _rule_signature(value.get("inputs") or [], value.get("output_variable"), value.get("output_term"))
+        for key, value in rules_data.items() if key.startswith("Rule") and isinstance(value, dict)
+    }
+    rules, errors = [], []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Each rule must be a JSON object"})
+            continue
+        inputs = item.get('inputs')
+        output_variable = item.get('output_variable')
+        output_term = item.get('output_term')
+        if not all([inputs, output_variable, output_term]) or not isinstance(inputs, list):
+            errors.append({"index": index, "error": "Incomplete data"})
+            continue
+
+        error = None
+        used = set()
+        for condition in inputs:
+            variable = condition.get("input_variable") if isinstance(condition, dict) else None
+            term = condition.get("input_term") if isinstance(condition, dict) else None
+            if variable not in terms["input"]:
+                error = f"Unknown input variable: {variable}"
+            elif term not in terms["input"][variable]:
+                error = f"Unknown term '{term}' for input variable {variable}"
+            elif variable in used:
+                error = f"Input variable {variable} is used more than once"
+            if error:
+                break
+            used.add(variable)
+        if error is None:
+            if output_variable not in terms["output"]:
+                error = f"Unknown output variable: {output_variable}"
+            elif output_term not in terms["output"][output_variable]:
+                error = f"Unknown term '{output_term}' for output variable {output_variable}"
+        if error is None:
+            signature = _rule_signature(inputs, output_variable, output_term)
+            if signature in seen:
+                error = "This rule already exists"
+            seen.add(signature)
+        if error:
+            errors.append({"index": index, "error": error})
+            continue
+
+        rules.append({
+            "inputs": [{"input_variable": c["input_variable"], "input_term": c["input_term"]} for c in inputs],
+            "output_variable": output_variable,
+            "output_term": output_term
+        })
+
+    return rules, errors
+
 @bp.route('/delete_rule/<rule_id>', methods=['DELETE'])
 def delete_rule(rule_id):
     """Elimina una regola fuzzy in base al suo ID."""  
     try:
-        rules_data = load_rule()
-
-        if rule_id in rules_data:
-            del rules_data[rule_id]
-            save_terms(rules_data)
+        if remove_rule(rule_id):
+            invalidate_model()
             return jsonify({"message": "Rule successfully deleted"}), 200
         else:
             return jsonify({"error": "Rule not found"}), 404
@@ -481,70 +815,458 @@ def delete_rule(rule_id):
     
 @bp.route('/infer', methods=['POST'])
 def infer():
-    """Esegue l'inferenza fuzzy sui valori di input forniti."""  
+    """Esegue l'inferenza fuzzy sui valori di input forniti.
+
+    verbosity ('results', 'results+activations', 'full') sceglie cosa restituire: le parti
+    escluse non vengono nemmeno calcolate. Con top_k le regole restituite sono solo le k
+    più attivate fra quelle scattate, con il conteggio complessivo in 'rule_summary'.
+    """
     try:
-        def compute_membership_y(term, x):
-            func = term.get("function_type")
-            params = term.get("params", {})
-
-            if func == "Triangolare":
-                a, b, c = params["a"], params["b"], params["c"]
-                return fuzz.trimf(x, [a, b, c])
-            elif func == "Trapezoidale":
-                a, b, c, d = params["a"], params["b"], params["c"], params["d"]
-                return fuzz.trapmf(x, [a, b, c, d])
-            elif func == "Gaussian":
-                mean, sigma = params["mean"], params["sigma"]
-                return fuzz.gaussmf(x, mean, sigma)
-
-            return np.zeros_like(x)
-
-        inputs = request.json.get("inputs")
-        terms_data = load_terms()
-        rules_data = load_rule()
+        payload = request.json
+        inputs = payload.get("inputs")
+        verbosity = payload.get("verbosity", request.args.get("verbosity", "full"))
+        if verbosity not in INFER_VERBOSITY:
+            return jsonify({"error": f"verbosity must be one of {', '.join(INFER_VERBOSITY)}"}), 400
+        top_k = payload.get("top_k", request.args.get("top_k", type=int))
+        if top_k is not None and not _is_int(top_k, 1, float("inf")):
+            return jsonify({"error": "top_k must be a positive integer"}), 400
+        full = verbosity == "full"
+        model = get_model()
+
+        # Risultato già calcolato per lo stesso modello e gli stessi input (arrotondati)
+        cache = get_result_cache(current_app.config)
+        cache_key = cache.key(get_session_id(), model, inputs)
+        if cache_key is not None:
+            cache_key += (verbosity, top_k)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return jsonify({**cached, "inputs": inputs} if full else cached)
+
+        row = batch_matrix(model, [inputs])
+        use_lookup = model.lookup is not None and not np.isnan(row).any()
+
+        # Il dizionario di fuzzificazione serve solo alla risposta completa; altrimenti le
+        # attivazioni vengono dalla riga di input, e in modalità tabulata non servono affatto
+        fuzzified = None
+        strengths = None
+        if full:
+            fuzzified = fuzzify_input(model.data, inputs)
+            strengths = apply_rules(model, fuzzified)
+        elif verbosity == "results+activations" or not use_lookup or model.class_outputs():
+            strengths = model.rule_strengths(model.fuzzify_batch(row))
+
+        # Modalità tabulata: interpolazione dalla superficie precalcolata se tutti gli input sono presenti
+        if use_lookup:
+            results = {var_name: float(values[0]) for var_name, values in model.lookup.interpolate(row).items()}
+        else:
+            results = aggregate_and_defuzzify(model, strengths, row)
+
+        full_result = {"results": results}
+
+        # Output Classification: punteggio di ogni classe, oltre all'etichetta vincente
+        scores = class_scores(model, strengths) if strengths is not None else {}
+        if scores:
+            full_result["scores"] = scores
+
+        # Regole da spiegare: tutte, oppure solo le top_k più attivate
+        if strengths is not None and verbosity != "results":
+            selected = np.arange(len(model.rules))
+            if top_k is not None:
+                selected = top_rules(strengths[0], top_k)
+                full_result["rule_summary"] = {
+                    "total": len(model.rules),
+                    "fired": int(np.count_nonzero(strengths[0] > 0)),
+                    "returned": len(selected)
+                }
 
-        rules = [
-            {
-                "inputs": rule["inputs"],
-                "output_variable": rule["output_variable"],
-                "output_term": rule["output_term"]
-            }
-            for key, rule in rules_data.items() if key.startswith("Rule")
-        ]
+        if verbosity == "results+activations":
+            full_result["rule_outputs"] = [
+                {
+                    "rule_id": model.rule_ids[r],
+                    "output_variable": model.rules[r]["output_variable"],
+                    "output_term": model.rules[r]["output_term"],
+                    "activation": float(strengths[0, r])
+                }
+                for r in selected
+            ]
+
+        if full:
+            full_result.update({
+                "inputs": inputs,
+                "fuzzified": fuzzified,
+                "rule_outputs": [
+                    {
+                        "rule_id": model.rule_ids[r],
+                        "output_variable": model.rules[r]["output_variable"],
+                        "output_term": model.rules[r]["output_term"],
+                        "activation": float(strengths[0, r]),
+                        "inputs": model.rules[r]["inputs"]
+                    }
+                    for r in selected
+                ]
+            })
 
-        for var_name, output_var in terms_data["output"].items():
-            domain_min, domain_max = output_var["domain"]
-            x = np.linspace(domain_min, domain_max, 1000)
-            for term in output_var["terms"]:
-                term["x"] = x.tolist()
-                term["y"] = compute_membership_y(term, x).tolist()
+            full_result["resolution"] = model.resolution_info()
 
-        fuzzified = fuzzify_input(terms_data, inputs)
-        rule_outputs = apply_rules(fuzzified, rules)
+            tabulated = model.lookup_info()
+            if tabulated:
+                full_result["tabulated"] = tabulated
 
-        for rule_out, original_rule in zip(rule_outputs, rules):
-            rule_out["inputs"] = original_rule["inputs"]
+            for r in selected:
+                full_result[model.rule_ids[r]] = model.data[model.rule_ids[r]]
 
-        results = aggregate_and_defuzzify(terms_data, rule_outputs)
+        if cache_key is not None:
+            cache.put(cache_key, full_result)
 
-        full_result = {
-            "inputs": inputs,
-            "fuzzified": fuzzified,
-            "rule_outputs": rule_outputs,
-            "results": results
+        return jsonify(full_result)
+
+    except Exception as e:
+        print(f"Error during /infer: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/infer_cache', methods=['GET', 'DELETE'])
+def infer_cache():
+    """Statistiche della cache dei risultati di /infer (hit, miss, occupazione); DELETE la svuota."""
+    cache = get_result_cache(current_app.config)
+    if request.method == 'DELETE':
+        cache.clear()
+    return jsonify(cache.stats())
+
+
+@bp.route('/infer_batch', methods=['POST'])
+def infer_batch():
+    """Esegue l'inferenza vettorizzata su una matrice di campioni (N x input) in una sola richiesta."""
+    try:
+        payload = request.get_json()
+        if not isinstance(payload, dict) or not isinstance(payload.get("inputs"), list):
+            return jsonify({"error": "'inputs' must be a list of records or rows"}), 400
+
+        model = get_model()
+        X = batch_matrix(model, payload["inputs"], payload.get("columns"))
+
+        # Con "scores": true si restituiscono anche i punteggi per classe (calcolo nel processo corrente)
+        if payload.get("scores") and model.class_outputs():
+            results, scores = batch_infer(model, X, with_scores=True)
+        else:
+            results, scores = run_batch(model, X), None
+
+        response = {
+            "count": int(X.shape[0]),
+            "results": {var_name: values.tolist() for var_name, values in results.items()}
         }
+        if scores:
+            response["scores"] = {
+                var_name: dict(zip(model.outputs[var_name]["term_names"], values.T.tolist()))
+                for var_name, values in scores.items()
+            }
+        return jsonify(response)
 
-        for key, rule in rules_data.items():
-            if key.startswith("Rule"):
-                full_result[key] = rule
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error during /infer_batch: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify(full_result)
 
+@bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Accoda un'inferenza batch (stesso formato di /infer_batch) e restituisce subito l'id del job."""
+    try:
+        payload = request.get_json()
+        if not isinstance(payload, dict) or not isinstance(payload.get("inputs"), list):
+            return jsonify({"error": "'inputs' must be a list of records or rows"}), 400
+
+        model = get_model()
+        X = batch_matrix(model, payload["inputs"], payload.get("columns"))
+        chunk_rows = current_app.config.get("JOB_CHUNK_ROWS", JOB_CHUNK_ROWS)
+
+        try:
+            job = get_job_manager(current_app.config).submit(get_session_id(), model, X, chunk_rows)
+        except QueueFull as e:
+            response = jsonify({"error": str(e)})
+            response.headers["Retry-After"] = "5"
+            return response, 429
+
+        response = jsonify(job.to_dict())
+        response.headers["Location"] = f"{request.script_root}/api/jobs/{job.id}"
+        return response, 202
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error during /infer: {e}")
+        print(f"Error during /jobs: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Stato, avanzamento e throughput di un job."""
+    job = get_job_manager(current_app.config).get(job_id, get_session_id())
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route('/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """Risultati di un job concluso (409 finché non è terminato con successo)."""
+    job = get_job_manager(current_app.config).get(job_id, get_session_id())
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status != DONE:
+        return jsonify({"error": f"Job is {job.status}", "status": job.status}), 409
+    return jsonify({
+        "count": job.total,
+        "results": {var_name: values.tolist() for var_name, values in job.results.items()}
+    })
+
+
+@bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Annulla un job in coda o in esecuzione."""
+    job = get_job_manager(current_app.config).cancel(job_id, get_session_id())
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route('/infer_stream', methods=['POST'])
+def infer_stream():
+    """Valuta un CSV (una colonna per variabile di input) restituendo i risultati in streaming, un record per riga.
+
+    In NDJSON 'row' è l'indice (da 0) della riga dati e 'line' la riga fisica del file (da 1):
+    entrambi contano anche le righe vuote, che vengono saltate senza produrre record.
+    """
+    try:
+        output_format = request.args.get("format", "ndjson")
+        if output_format not in ("ndjson", "csv"):
+            return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+        chunk_rows = max(1, int(request.args.get("chunk_size", STREAM_CHUNK_ROWS)))
+
+        # Il CSV è il corpo grezzo della richiesta (text/csv), letto a blocchi senza bufferizzarlo
+        stream = io.TextIOWrapper(io.BufferedReader(request.stream), encoding="utf-8", newline="")
+        reader = csv.reader(stream)
+
+        header = [name.strip() for name in next(reader, [])]
+        header_line = reader.line_num
+        if not header:
+            return jsonify({"error": "Empty CSV: a header row with the input variables is required"}), 400
+
+        model = get_model()
+        position = {name: i for i, name in enumerate(model.input_names)}
+        unknown = [name for name in header if name not in position]
+        if unknown:
+            return jsonify({"error": f"Unknown input variables: {', '.join(unknown)}"}), 400
+        columns = [position[name] for name in header]
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error during /infer_stream: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        if output_format == "csv":
+            yield ",".join(model.active_outputs) + "\n"
+
+        for chunk in csv_chunks(reader, chunk_rows):
+            line_numbers = [line for line, _ in chunk]
+            rows = [row for _, row in chunk]
+            X = np.full((len(rows), len(model.input_names)), np.nan)
+            errors = {}
+            for i, row in enumerate(rows):
+                try:
+                    values = [float(cell) if cell.strip() else np.nan for cell in row]
+                    if len(values) != len(columns):
+                        raise ValueError(f"expected {len(columns)} columns, found {len(values)}")
+                    X[i, columns] = values
+                except ValueError as e:
+                    errors[i] = str(e)
+
+            results = {var_name: values.tolist() for var_name, values in batch_infer(model, X).items()}
+
+            lines = []
+            for i in range(len(rows)):
+                if output_format == "csv":
+                    cells = ["" if i in errors else str(results[var_name][i]) for var_name in model.active_outputs]
+                    lines.append(",".join(cells))
+                else:
+                    record = {"row": line_numbers[i] - header_line - 1, "line": line_numbers[i]}
+                    if i in errors:
+                        record["error"] = errors[i]
+                    else:
+                        record.update({var_name: values[i] for var_name, values in results.items()})
+                    lines.append(json.dumps(record))
+            yield "\n".join(lines) + "\n"
+
+    mimetype = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+@bp.route('/infer_npy', methods=['POST'])
+def infer_npy():
+    """Inferenza batch binaria: riceve un .npy o float64 little-endian grezzi (N x input) e restituisce un .npy."""
+    try:
+        model = get_model()
+        n_inputs = len(model.input_names)
+        if not n_inputs:
+            return jsonify({"error": "No input variables defined"}), 400
+
+        spool_bytes = current_app.config.get("NPY_SPOOL_BYTES", NPY_SPOOL_BYTES)
+        with tempfile.TemporaryFile() if (request.content_length or 0) > spool_bytes else io.BytesIO() as spool:
+            X = read_npy_body(spool, n_inputs, spooled=not isinstance(spool, io.BytesIO))
+            results = run_batch(model, X, class_index=True)
+            n_samples = X.shape[0]
+            del X
+
+        output = np.empty((n_samples, len(model.active_outputs)))
+        for j, var_name in enumerate(model.active_outputs):
+            output[:, j] = results[var_name]
+
+        buffer = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        np.save(buffer, output)
+        buffer.seek(0)
+
+        response = send_file(buffer, mimetype="application/octet-stream", download_name="results.npy")
+        response.headers["X-FIS-Columns"] = ",".join(model.active_outputs)
+        classes = {
+            var_name: model.outputs[var_name]["term_names"]
+            for var_name in model.active_outputs if model.outputs[var_name]["is_classification"]
+        }
+        if classes:
+            response.headers["X-FIS-Classes"] = json.dumps(classes)
+        return response
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error during /infer_npy: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+def run_batch(model, X, class_index=False):
+    """Inferenza batch nel processo corrente o, con più worker configurati, su un pool di processi.
+
+    Worker e dimensione dei blocchi vengono da BATCH_WORKERS / BATCH_CHUNK_ROWS nella config
+    dell'app e possono essere sovrascritti con ?workers= e ?chunk_size=.
+    """
+    workers = request.args.get("workers", current_app.config.get("BATCH_WORKERS", 1), type=int)
+    chunk_rows = request.args.get("chunk_size", current_app.config.get("BATCH_CHUNK_ROWS", PARALLEL_CHUNK_ROWS), type=int)
+    workers = min(max(1, workers), max_workers())
+    chunk_rows = max(1, chunk_rows)
+
+    if workers > 1 and X.shape[0] > chunk_rows:
+        return parallel_batch_infer(model, X, workers, chunk_rows, class_index)
+    return batch_infer(model, X, class_index)
+
+
+def read_npy_body(spool, n_inputs, spooled):
+    """Legge il corpo binario come matrice (N x n_inputs) senza passare da liste Python.
+
+    I corpi piccoli vengono letti con np.frombuffer; quelli grandi sono copiati a blocchi
+    su un file temporaneo e aperti con np.memmap.
+    """
+    if spooled:
+        while True:
+            block = request.stream.read(1024 * 1024)
+            if not block:
+                break
+            spool.write(block)
+    else:
+        spool.write(request.get_data())
+    spool.seek(0)
+
+    dtype, shape, fortran_order, offset = np.dtype("<f8"), None, False, 0
+    if spool.read(6) == b"\x93NUMPY":
+        spool.seek(0)
+        version = np.lib.format.read_magic(spool)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(spool)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(spool)
+        offset = spool.tell()
+        if dtype.hasobject:
+            raise ValueError("Object arrays are not supported")
+
+    size = spool.seek(0, io.SEEK_END) - offset
+    if shape is None:
+        if size % (dtype.itemsize * n_inputs):
+            raise ValueError(f"Body size is not a multiple of {n_inputs} float64 values")
+        shape = (size // (dtype.itemsize * n_inputs), n_inputs)
+    if len(shape) != 2 or shape[1] != n_inputs:
+        raise ValueError(f"Expected an array of shape (N, {n_inputs}), one column per input variable")
+
+    order = "F" if fortran_order else "C"
+    if spooled:
+        spool.flush()
+        return np.memmap(spool, dtype=dtype, mode="r", offset=offset, shape=tuple(shape), order=order)
+    return np.frombuffer(spool.getbuffer(), dtype=dtype, offset=offset).reshape(shape, order=order)
+
+
+def csv_chunks(reader, size):
+    """Raggruppa le righe non vuote di un csv.reader in blocchi di al più size coppie (riga fisica, riga).
+
+    Il numero di riga è quello del file (reader.line_num), quindi conta anche le righe vuote saltate.
+    """
+    chunk = []
+    for row in reader:
+        if not row:
+            continue
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def batch_matrix(model, rows, columns=None):
+    """Converte record (dict) o righe (liste) nella matrice di input del modello; NaN per gli input assenti.
+
+    Tutte le righe devono essere dello stesso tipo della prima; altrimenti ValueError con l'indice della riga.
+    """
+    X = np.full((len(rows), len(model.input_names)), np.nan)
+    position = {name: i for i, name in enumerate(model.input_names)}
+
+    if rows and isinstance(rows[0], dict):
+        for i, record in enumerate(rows):
+            if not isinstance(record, dict):
+                raise ValueError(f"Row {i}: expected an object of input values like the first row")
+            for var_name, value in record.items():
+                if var_name in position and value is not None:
+                    try:
+                        X[i, position[var_name]] = value
+                    except (TypeError, ValueError):
+                        raise ValueError(f"Row {i}: invalid value for '{var_name}'")
+        return X
+
+    columns = columns or model.input_names
+    if not isinstance(columns, list):
+        raise ValueError("'columns' must be a list of input variable names")
+    unknown = [name for name in columns if name not in position]
+    if unknown:
+        raise ValueError(f"Unknown input variables: {', '.join(map(str, unknown))}")
+
+    try:
+        values = np.array(rows, dtype=float).reshape(len(rows), len(columns))
+    except (TypeError, ValueError):
+        raise ValueError(_bad_row_error(rows, len(columns)))
+    X[:, [position[name] for name in columns]] = values
+    return X
+
+
+def _bad_row_error(rows, n_columns):
+    """Messaggio per la prima riga (lista) che non è convertibile in n_columns numeri."""
+    for i, row in enumerate(rows):
+        if not isinstance(row, list) or len(row) != n_columns:
+            return f"Row {i}: expected a list of {n_columns} values like the first row"
+        try:
+            np.array(row, dtype=float)
+        except (TypeError, ValueError):
+            return f"Row {i}: values must be numbers"
+    return f"Rows must be lists of {n_columns} numbers"
+
     
 def fuzzify_input(terms_data, inputs):
     """Fuzzifica i valori di input rispetto ai termini fuzzy delle variabili."""  
@@ -554,116 +1276,152 @@ def fuzzify_input(terms_data, inputs):
         if not variable:
             continue
 
-        domain_min, domain_max = variable["domain"]
-        x = np.linspace(domain_min, domain_max, 100)
         memberships = {}
 
         for term in variable["terms"]:
-            name = term["term_name"]
-            ftype = term["function_type"]
-            p = term["params"]
-
-            if ftype == "Triangolare":
-                y = fuzz.trimf(x, [p["a"], p["b"], p["c"]])
-            elif ftype == "Gaussian":
-                y = fuzz.gaussmf(x, p["mean"], p["sigma"])
-            elif ftype == "Trapezoidale":
-                y = fuzz.trapmf(x, [p["a"], p["b"], p["c"], p["d"]])
-            elif ftype == "Triangolare-open":
-                y = fuzz.trimf(x, [p["a"], p["b"], p["c"]])
-                y[x < p["a"]] = 0
-                y[x > p["c"]] = 0
-            elif ftype == "Gaussian-open":
-                y = fuzz.gaussmf(x, p["mean"], p["sigma"])
-                y[x < domain_min] = 0
-                y[x > domain_max] = 0
-            elif ftype == "Trapezoidale-open":
-                y = fuzz.trapmf(x, [p["a"], p["b"], p["c"], p["d"]])
-                y[x < p["a"]] = 0
-                y[x > p["d"]] = 0
-            else:
+            # Valutazione analitica nel punto esatto (il valore è limitato al dominio)
+            mu = membership.fuzzify_value(term, value, variable["domain"])
+            if mu is None:
                 continue
-
-            mu = np.interp(value, x, y)
-            memberships[name] = mu
+            memberships[term["term_name"]] = mu
 
         fuzzified[var_name] = memberships
     return fuzzified
 
 
-def apply_rules(fuzzified_inputs, rules):
-    """Applica le regole fuzzy calcolando l'attivazione per ciascuna."""  
-    rule_outputs = []
-
-    for rule in rules:
-        strength = 1.0
-        for cond in rule["inputs"]:
-            var = cond["input_variable"]
-            term = cond["input_term"]
-            mu = fuzzified_inputs.get(var, {}).get(term, 0)
-            strength = min(strength, mu)
+def apply_rules(model, fuzzified):
+    """Calcola le attivazioni di tutte le regole con un gather sulla matrice regola x antecedente e un min."""
+    memberships = model.membership_vector(fuzzified)
+    return model.rule_strengths(memberships)
 
-        rule_outputs.append({
-            "output_variable": rule["output_variable"],
-            "output_term": rule["output_term"],
-            "activation": strength
-        })
-    return rule_outputs
 
+def aggregate_and_defuzzify(model, strengths, row=None):
+    """Riduce le attivazioni con un max per termine conseguente, poi aggrega e defuzzifica.
 
-def aggregate_and_defuzzify(terms_data, rule_outputs):
+    row è la matrice 1 x input del campione, necessaria per i conseguenti Sugeno lineari.
+    """
     results = {}
-    output_terms_by_var = {}
 
-    for rule in rule_outputs:
-        var_name = rule["output_variable"]
-        term_name = rule["output_term"]
-        activation = rule["activation"]
+    for var_name in model.active_outputs:
+        activations = model.term_activations(strengths, var_name)
+        value = model.defuzzify_batch(activations, var_name, X=row)[0]
+        results[var_name] = value if model.outputs[var_name]["is_classification"] else float(value)
 
-        if var_name not in output_terms_by_var:
-            output_terms_by_var[var_name] = {}
+    return results
 
-        if term_name not in output_terms_by_var[var_name]:
-            output_terms_by_var[var_name][term_name] = 0.0
 
-        output_terms_by_var[var_name][term_name] = max(
-            output_terms_by_var[var_name][term_name],
-            activation
-        )
+def top_rules(activations, k):
+    """Indici delle k regole scattate (attivazione > 0) più attivate, in ordine decrescente.
 
-    for var_name, terms in output_terms_by_var.items():
-        term_defs = terms_data["output"][var_name]["terms"]
-        is_classification = term_defs[0].get("function_type") == "Classification"
+    np.argpartition seleziona le k migliori in tempo lineare; solo quelle vengono ordinate.
+    """
+    fired = np.flatnonzero(activations > 0)
+    if len(fired) > k:
+        fired = fired[np.argpartition(activations[fired], len(fired) - k)[len(fired) - k:]]
+    return fired[np.argsort(-activations[fired], kind="stable")]
 
-        if is_classification:
-            best_term = max(terms.items(), key=lambda x: x[1])[0]
-            results[var_name] = best_term
-        else:
-            domain_min, domain_max = terms_data["output"][var_name]["domain"]
-            x = np.linspace(domain_min, domain_max, 1000)
-            aggregated = np.zeros_like(x)
-
-            for term_def in term_defs:
-                term_name = term_def["term_name"]
-                y = np.array(term_def["y"])
-                weight = terms.get(term_name, 0.0)
-                aggregated = np.fmax(aggregated, np.fmin(weight, y))
-
-            if aggregated.sum() == 0:
-                results[var_name] = 0
-            else:
-                result = fuzz.defuzz(x, aggregated, 'centroid')
-                results[var_name] = result
 
-    return results
+def class_scores(model, strengths):
+    """Punteggi per classe {variabile: {classe: attivazione massima}} delle variabili Classification."""
+    return {
+        var_name: dict(zip(model.outputs[var_name]["term_names"],
+                           model.term_activations(strengths, var_name)[0].tolist()))
+        for var_name in model.class_outputs()
+    }
+
+
+
+@bp.route('/control_surface', methods=['POST'])
+def get_control_surface():
+    """Superficie di controllo: output su una griglia 2-D di due input, con gli altri input fissati."""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid data format. Must be a JSON object."}), 400
+
+        nx = int(data.get("nx", SURFACE_POINTS))
+        ny = int(data.get("ny", SURFACE_POINTS))
+        if not (2 <= nx <= SURFACE_MAX_POINTS and 2 <= ny <= SURFACE_MAX_POINTS):
+            return jsonify({"error": f"nx and ny must be between 2 and {SURFACE_MAX_POINTS}"}), 400
+        fixed = data.get("fixed") or {}
+        if not isinstance(fixed, dict):
+            return jsonify({"error": "'fixed' must be an object of input values"}), 400
+
+        model = get_model()
+        axes, values, z = control_surface(model, data.get("x"), data.get("y"), nx, ny, fixed)
+
+        outputs = data.get("outputs") or model.active_outputs
+        unknown = [name for name in outputs if name not in z]
+        if unknown:
+            return jsonify({"error": f"Unknown or unused output variables: {', '.join(unknown)}"}), 400
+
+        return jsonify({
+            "x": {"variable": data["x"], "values": axes[data["x"]].tolist()},
+            "y": {"variable": data["y"], "values": axes[data["y"]].tolist()},
+            "fixed": values,
+            "downsampled": len(axes[data["x"]]) < nx or len(axes[data["y"]]) < ny,
+            "z": {name: z[name].tolist() for name in outputs},
+            "classes": {
+                name: model.outputs[name]["term_names"]
+                for name in outputs if model.outputs[name]["is_classification"]
+            }
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error during /control_surface: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+#IMPOSTAZIONI DI SESSIONE
+@bp.route('/settings', methods=['GET'])
+def get_settings():
+    """Restituisce le impostazioni della sessione."""
+    try:
+        return jsonify(load_settings()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
+@bp.route('/settings', methods=['PUT'])
+def update_settings():
+    """Aggiorna le impostazioni della sessione: ogni sezione inviata viene unita a quella salvata."""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid data format. Must be a JSON object."}), 400
+
+        error = validate_settings(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        settings = load_settings()
+        for section, values in data.items():
+            settings[section] = {**(settings.get(section) or {}), **values}
+        save_settings(settings)
+        invalidate_model()
+
+        return jsonify(settings), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/tabulated', methods=['GET'])
+def get_tabulated():
+    """Stato della modalità tabulata del modello corrente (griglia ed errore massimo di validazione)."""
+    try:
+        return jsonify(get_model().lookup_info() or {"enabled": False}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 
 #IMPORT/EXPORT
 @bp.route("/export_json", methods=["GET"])
 def export_json():
     try:
-        data = load_data()
+        data = load_data(readonly=True)
 
         ordered_data = {}
 
@@ -680,6 +1438,10 @@ def export_json():
         sorted_rules = dict(sorted(rules.items(), key=lambda x: int(x[0].replace("Rule", ""))))
         ordered_data.update(sorted_rules)
 
+        # 4. impostazioni della sessione
+        if data.get("settings"):
+            ordered_data["settings"] = data["settings"]
+
         # Usa json.dumps per mantenere l’ordine
         json_data = json.dumps(ordered_data, indent=4, ensure_ascii=False)
 
@@ -703,6 +1465,7 @@ def import_json():
 
         # Salva direttamente come file di sessione
         save_data(data)
+        invalidate_model()
 
         return jsonify({"message": "Import completed"}), 200
 
@@ -0,0 +1,802 @@
+import os
+import json
+import queue
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Chiave della sessione con la versione del modello, incrementata a ogni scrittura
+VERSION_KEY = "model_version"
+
+# Contatore degli id delle regole: il prossimo RuleN è sempre almeno questo numero, così gli
+# id non vengono riusati e non serve scorrere tutte le regole per generarne uno nuovo
+RULE_COUNTER_KEY = "rule_counter"
+
+VAR_TYPES = ("input", "output")
+
+# Dimensione del journal oltre la quale viene compattato nello snapshot (JournalStorage)
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+
+def _copy(value):
+    """Copia profonda di dati JSON (dict, liste, scalari), molto più rapida di copy.deepcopy."""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _rule_number(rule_id):
+    try:
+        return int(rule_id[len("Rule"):])
+    except ValueError:
+        return None
+
+
+def _rule_counter(data):
+    """Prossimo numero di regola libero: il contatore salvato o il massimo RuleN + 1, se maggiore."""
+    numbers = [_rule_number(key) for key, value in data.items() if key.startswith("Rule") and isinstance(value, dict)]
+    counter = data.get(RULE_COUNTER_KEY)
+    return max([n + 1 for n in numbers if n is not None] + [counter if isinstance(counter, int) else 0])
+
+
+def lock_path(base_dir, session_id):
+    """File usato come lock della sessione (condiviso da richieste, processi e compattatore)."""
+    return os.path.join(base_dir, f"session_{session_id}.lock")
+
+
+@contextmanager
+def file_lock(path):
+    """Lock consultivo esclusivo su un file, fra thread e processi (non rientrante)."""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# === Modifiche granulari della sessione ===
+# Ogni funzione modifica il dizionario di primo livello ricevuto ma copia i livelli annidati
+# che tocca, così gli oggetti condivisi (letture readonly) restano invariati. Sono usate sia
+# dall'implementazione generica di Storage sia per riapplicare il journal di JournalStorage.
+
+def _own_variable(data, var_type, var_name, domain=None):
+    variables = data[var_type] = dict(data.get(var_type) or {})
+    variable = variables.get(var_name)
+    variable = variables[var_name] = dict(variable) if variable is not None else {"domain": domain}
+    variable["terms"] = list(variable.get("terms", []))
+    return variable
+
+
+def _advance_counter(data, number):
+    if number is None:
+        return
+    counter = data.get(RULE_COUNTER_KEY)
+    data[RULE_COUNTER_KEY] = max(counter if isinstance(counter, int) else _rule_counter(data), number + 1)
+
+
+def _add_terms(data, entries):
+    for var_type, var_name, domain, term in entries:
+        _own_variable(data, var_type, var_name, domain)["terms"].append(term)
+
+
+def _update_term(data, var_type, var_name, term_name, term):
+    terms = _own_variable(data, var_type, var_name)["terms"]
+    terms[next(i for i, t in enumerate(terms) if t.get("term_name") == term_name)] = term
+
+
+def _delete_term(data, var_type, var_name, term_name):
+    variable = _own_variable(data, var_type, var_name)
+    variable["terms"] = [t for t in variable["terms"] if t.get("term_name") != term_name]
+
+
+def _add_rules(data, rule_ids, rules):
+    data.update(zip(rule_ids, rules))
+    for rule_id in rule_ids:
+        _advance_counter(data, _rule_number(rule_id))
+
+
+def _delete_rule(data, rule_id):
+    data.pop(rule_id, None)
+
+
+MUTATIONS = {
+    "add_terms": _add_terms,
+    "update_term": _update_term,
+    "delete_term": _delete_term,
+    "add_rules": _add_rules,
+    "delete_rule": _delete_rule,
+}
+
+
+class Storage(ABC):
+    """Interfaccia dei backend di persistenza delle sessioni.
+
+    load/save lavorano sull'intera sessione nel formato JSON storico (input, output, RuleN, ...).
+    Le operazioni sui singoli termini e regole hanno qui un'implementazione generica
+    (lettura, modifica, riscrittura completa) che i backend possono sostituire.
+    """
+
+    @abstractmethod
+    def load(self, session_id, readonly=False):
+        """Sessione completa; readonly indica che il chiamante non la modificherà."""
+
+    @abstractmethod
+    def save(self, session_id, data):
+        """Sostituisce l'intera sessione."""
+
+    def version(self, session_id):
+        return int(self.load(session_id, readonly=True).get(VERSION_KEY, 0))
+
+    def _mutate(self, session_id, op, *args):
+        """Applica una delle MUTATIONS alla sessione e la salva."""
+        data = self.load(session_id)
+        MUTATIONS[op](data, *args)
+        self.save(session_id, data)
+
+    # === Variabili e termini ===
+
+    def variable_names(self, session_id, var_type):
+        return list((self.load(session_id, readonly=True).get(var_type) or {}).keys())
+
+    def get_variable(self, session_id, var_type, name):
+        """Copia della variabile ({"domain", "terms", ...}), None se non esiste."""
+        variable = (self.load(session_id, readonly=True).get(var_type) or {}).get(name)
+        return _copy(variable) if variable is not None else None
+
+    def find_term(self, session_id, term_name, variable_name=None):
+        """(tipo, variabile, termine) del primo termine con quel nome (input prima degli output), o None."""
+        data = self.load(session_id, readonly=True)
+        for var_type in VAR_TYPES:
+            for name, variable in (data.get(var_type) or {}).items():
+                if variable_name is not None and name != variable_name:
+                    continue
+                for term in variable.get("terms", []):
+                    if term.get("term_name") == term_name:
+                        return var_type, name, _copy(term)
+        return None
+
+    def add_term(self, session_id, var_type, var_name, domain, term):
+        """Aggiunge un termine, creando la variabile se non esiste."""
+        self.add_terms(session_id, [(var_type, var_name, domain, term)])
+
+    def add_terms(self, session_id, entries):
+        """Aggiunge più termini (tipo, variabile, dominio, termine) con un'unica scrittura."""
+        self._mutate(session_id, "add_terms", [list(entry) for entry in entries])
+
+    def update_term(self, session_id, var_type, var_name, term_name, term):
+        self._mutate(session_id, "update_term", var_type, var_name, term_name, term)
+
+    def delete_term(self, session_id, var_type, var_name, term_name):
+        self._mutate(session_id, "delete_term", var_type, var_name, term_name)
+
+    # === Regole ===
+
+    def next_rule_id(self, session_id):
+        data = self.load(session_id, readonly=True)
+        counter = data.get(RULE_COUNTER_KEY)
+        return f"Rule{counter if isinstance(counter, int) else _rule_counter(data)}"
+
+    def add_rule(self, session_id, rule_id, rule):
+        self._mutate(session_id, "add_rules", [rule_id], [rule])
+
+    def add_rules(self, session_id, rules):
+        """Aggiunge più regole con id consecutivi dal contatore e un'unica scrittura; restituisce gli id."""
+        first = _rule_number(self.next_rule_id(session_id))
+        rule_ids = [f"Rule{first + k}" for k in range(len(rules))]
+        self._mutate(session_id, "add_rules", rule_ids, list(rules))
+        return rule_ids
+
+    def delete_rule(self, session_id, rule_id):
+        """Elimina la regola; False se non esiste."""
+        if rule_id not in self.load(session_id, readonly=True):
+            return False
+        self._mutate(session_id, "delete_rule", rule_id)
+        return True
+
+
+class JSONStorage(Storage):
+    """Un file JSON per sessione, con copia in memoria validata su inode/mtime/dimensione."""
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        # Sessioni già lette, per percorso: {"stat": firma del file, "data": dati}. Il file resta
+        # la fonte di verità: se la firma cambia (scrittura esterna) la sessione viene riletta.
+        self.store = {}
+        self.lock = threading.Lock()
+
+    def path(self, session_id):
+        return os.path.join(self.base_dir, f"session_{session_id}.json")
+
+    @staticmethod
+    def _signature(file_path):
+        st = os.stat(file_path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self, session_id, readonly=False):
+        """Dati della sessione ({} se non esiste). Con readonly=True l'oggetto condiviso, da non modificare."""
+        file_path = self.path(session_id)
+        if not os.path.exists(file_path):
+            return {}
+        signature = self._signature(file_path)
+        with self.lock:
+            entry = self.store.get(file_path)
+        if entry is None or entry["stat"] != signature:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+            entry = {"stat": signature, "data": data}
+            with self.lock:
+                self.store[file_path] = entry
+        return entry["data"] if readonly else _copy(entry["data"])
+
+    def save(self, session_id, data):
+        """Salva l'intera sessione con una nuova versione."""
+        data[VERSION_KEY] = self.version(session_id) + 1
+        data[RULE_COUNTER_KEY] = _rule_counter(data)
+        self._write(session_id, data)
+
+    def _write(self, session_id, data):
+        """Scrive la sessione in un file temporaneo e lo sostituisce con una rename atomica.
+
+        Un lettore vede sempre la versione precedente o quella nuova, mai un file troncato.
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+        file_path = self.path(session_id)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.base_dir, prefix=".session_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        entry = {"stat": self._signature(file_path), "data": _copy(data)}
+        with self.lock:
+            self.store[file_path] = entry
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    rule_counter INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS variables (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (session_id, kind, name)
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    variable_id INTEGER NOT NULL REFERENCES variables (id) ON DELETE CASCADE,
+    session_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (variable_id, name)
+);
+CREATE INDEX IF NOT EXISTS terms_by_name ON terms (session_id, name);
+CREATE TABLE IF NOT EXISTS rules (
+    session_id TEXT NOT NULL,
+    rule_id TEXT NOT NULL,
+    number INTEGER,
+    output_variable TEXT,
+    output_term TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, rule_id)
+);
+CREATE INDEX IF NOT EXISTS rules_by_number ON rules (session_id, number);
+CREATE TABLE IF NOT EXISTS antecedents (
+    session_id TEXT NOT NULL,
+    rule_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    input_variable TEXT,
+    input_term TEXT,
+    PRIMARY KEY (session_id, rule_id, position)
+);
+CREATE INDEX IF NOT EXISTS antecedents_by_term ON antecedents (session_id, input_variable, input_term);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Sessioni in un database SQLite, con tabelle e indici per variabili, termini, regole e antecedenti.
+
+    Le modifiche a un singolo termine o regola sono aggiornamenti di righe tramite indice; la
+    sessione completa viene ricostruita solo quando la versione cambia. Se una sessione non è
+    ancora nel database viene importata dal backend legacy (i file JSON), se indicato.
+    """
+
+    def __init__(self, path, legacy=None):
+        self.path = path
+        self.legacy = legacy
+        self.local = threading.local()
+        self.cache = {}
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        # Database creati prima dell'introduzione del contatore delle regole
+        if "rule_counter" not in [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]:
+            conn.execute("ALTER TABLE sessions ADD COLUMN rule_counter INTEGER NOT NULL DEFAULT 0")
+            conn.execute("UPDATE sessions SET rule_counter = COALESCE("
+                         "(SELECT MAX(number) + 1 FROM rules WHERE rules.session_id = sessions.id), 0)")
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, write=True):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bump(self, conn, session_id):
+        conn.execute("INSERT OR IGNORE INTO sessions (id) VALUES (?)", (session_id,))
+        conn.execute("UPDATE sessions SET version = version + 1 WHERE id = ?", (session_id,))
+
+    def _variable_id(self, conn, session_id, var_type, name):
+        row = conn.execute(
+            "SELECT id FROM variables WHERE session_id = ? AND kind = ? AND name = ?",
+            (session_id, var_type, name)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _import_legacy(self, session_id):
+        """Copia nel database una sessione esistente solo come file JSON."""
+        if self.legacy is None:
+            return False
+        data = self.legacy.load(session_id)
+        if not data:
+            return False
+        with self._transaction() as conn:
+            # Un'altra richiesta può averla già importata: la versione non va incrementata due volte
+            if conn.execute("SELECT 1 FROM sessions WHERE id = ? AND version > 0", (session_id,)).fetchone() is None:
+                self._replace(conn, session_id, data)
+        return True
+
+    def _ensure(self, session_id):
+        """Importa la sessione legacy prima di un'operazione granulare, se nel database non c'è."""
+        self.version(session_id)
+
+    def _stored_version(self, session_id):
+        row = self._connection().execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def version(self, session_id):
+        """Versione della sessione, importando prima quella legacy: l'ETag non cambia con l'import."""
+        version = self._stored_version(session_id)
+        if version == 0 and self._import_legacy(session_id):
+            version = self._stored_version(session_id)
+        return version
+
+    def load(self, session_id, readonly=False):
+        version = self.version(session_id)
+        with self.lock:
+            cached = self.cache.get(session_id)
+        if cached is None or cached[0] != version:
+            version, data = self._assemble(session_id)
+            cached = (version, data)
+            with self.lock:
+                self.cache[session_id] = cached
+        return cached[1] if readonly else _copy(cached[1])
+
+    def _assemble(self, session_id):
+        """Ricostruisce la sessione nel formato JSON in un'unica transazione di lettura."""
+        with self._transaction(write=False) as conn:
+            row = conn.execute(
+                "SELECT version, rule_counter, extra FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return 0, {}
+            version, rule_counter, extra = row
+            data = {}
+
+            variables = {}
+            for var_id, kind, name, variable in conn.execute(
+                    "SELECT id, kind, name, data FROM variables WHERE session_id = ? ORDER BY id", (session_id,)):
+                variable = json.loads(variable)
+                variable["terms"] = []
+                data.setdefault(kind, {})[name] = variable
+                variables[var_id] = variable
+            for var_id, term in conn.execute(
+                    "SELECT variable_id, data FROM terms WHERE session_id = ? ORDER BY id", (session_id,)):
+                variables[var_id]["terms"].append(json.loads(term))
+
+            rules = {}
+            for rule_id, rule in conn.execute(
+                    "SELECT rule_id, data FROM rules WHERE session_id = ? ORDER BY rowid", (session_id,)):
+                rule = json.loads(rule)
+                rule["inputs"] = []
+                rules[rule_id] = rule
+            for rule_id, input_variable, input_term in conn.execute(
+                    "SELECT rule_id, input_variable, input_term FROM antecedents "
+                    "WHERE session_id = ? ORDER BY rule_id, position", (session_id,)):
+                rules[rule_id]["inputs"].append({"input_variable": input_variable, "input_term": input_term})
+            data.update(rules)
+
+            data.update(json.loads(extra))
+            data[RULE_COUNTER_KEY] = rule_counter
+            data[VERSION_KEY] = version
+        return version, data
+
+    def save(self, session_id, data):
+        """Sostituisce l'intera sessione (import, salvataggi completi) in una transazione."""
+        with self._transaction() as conn:
+            self._replace(conn, session_id, data)
+
+    def _replace(self, conn, session_id, data):
+        for table in ("antecedents", "rules", "terms", "variables"):
+            conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+        extra = {}
+        for key, value in data.items():
+            if key in VAR_TYPES and isinstance(value, dict):
+                for name, variable in value.items():
+                    self._insert_variable(conn, session_id, key, name, variable)
+            elif key.startswith("Rule") and isinstance(value, dict):
+                self._insert_rule(conn, session_id, key, value)
+            elif key not in (VERSION_KEY, RULE_COUNTER_KEY):
+                extra[key] = value
+
+        self._bump(conn, session_id)
+        data[RULE_COUNTER_KEY] = _rule_counter(data)
+        conn.execute("UPDATE sessions SET rule_counter = ?, extra = ? WHERE id = ?",
+                     (data[RULE_COUNTER_KEY], json.dumps(extra), session_id))
+        data[VERSION_KEY] = conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+
+    def _advance_counter(self, conn, session_id, number):
+        if number is not None:
+            conn.execute("UPDATE sessions SET rule_counter = MAX(rule_counter, ?) WHERE id = ?", (number, session_id))
+
+    def _insert_variable(self, conn, session_id, var_type, name, variable):
+        fields = {key: value for key, value in variable.items() if key != "terms"}
+        var_id = conn.execute(
+            "INSERT INTO variables (session_id, kind, name, data) VALUES (?, ?, ?, ?)",
+            (session_id, var_type, name, json.dumps(fields))
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO terms (variable_id, session_id, name, data) VALUES (?, ?, ?, ?)",
+            [(var_id, session_id, term.get("term_name"), json.dumps(term)) for term in variable.get("terms", [])]
+        )
+        return var_id
+
+    def _insert_rule(self, conn, session_id, rule_id, rule):
+        fields = {key: value for key, value in rule.items() if key != "inputs"}
+        conn.execute(
+            "INSERT INTO rules (session_id, rule_id, number, output_variable, output_term, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, rule_id, _rule_number(rule_id), rule.get("output_variable"),
+             rule.get("output_term"), json.dumps(fields))
+        )
+        conn.executemany(
+            "INSERT INTO antecedents (session_id, rule_id, position, input_variable, input_term) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(session_id, rule_id, k, cond.get("input_variable"), cond.get("input_term"))
+             for k, cond in enumerate(rule.get("inputs") or [])]
+        )
+
+    # === Operazioni granulari (una riga, tramite indice) ===
+
+    def variable_names(self, session_id, var_type):
+        self._ensure(session_id)
+        return [row[0] for row in self._connection().execute(
+            "SELECT name FROM variables WHERE session_id = ? AND kind = ? ORDER BY id", (session_id, var_type))]
+
+    def get_variable(self, session_id, var_type, name):
+        self._ensure(session_id)
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT id, data FROM variables WHERE session_id = ? AND kind = ? AND name = ?",
+            (session_id, var_type, name)
+        ).fetchone()
+        if row is None:
+            return None
+        variable = json.loads(row[1])
+        variable["terms"] = [json.loads(term) for (term,) in conn.execute(
+            "SELECT data FROM terms WHERE variable_id = ? ORDER BY id", (row[0],))]
+        return variable
+
+    def find_term(self, session_id, term_name, variable_name=None):
+        self._ensure(session_id)
+        query = ("SELECT v.kind, v.name, t.data FROM terms t JOIN variables v ON v.id = t.variable_id "
+                 "WHERE t.session_id = ? AND t.name = ?")
+        params = [session_id, term_name]
+        if variable_name is not None:
+            query += " AND v.name = ?"
+            params.append(variable_name)
+        query += " ORDER BY v.kind = 'output', v.id LIMIT 1"
+        row = self._connection().execute(query, params).fetchone()
+        return (row[0], row[1], json.loads(row[2])) if row else None
+
+    def add_terms(self, session_id, entries):
+        self._ensure(session_id)
+        with self._transaction() as conn:
+            var_ids = {}
+            rows = []
+            for var_type, var_name, domain, term in entries:
+                key = (var_type, var_name)
+                if key not in var_ids:
+                    var_ids[key] = self._variable_id(conn, session_id, var_type, var_name)
+                    if var_ids[key] is None:
+                        var_ids[key] = self._insert_variable(
+                            conn, session_id, var_type, var_name, {"domain": domain, "terms": []})
+                rows.append((var_ids[key], session_id, term.get("term_name"), json.dumps(term)))
+            conn.executemany("INSERT INTO terms (variable_id, session_id, name, data) VALUES (?, ?, ?, ?)", rows)
+            self._bump(conn, session_id)
+
+    def update_term(self, session_id, var_type, var_name, term_name, term):
+        self._ensure(session_id)
+        with self._transaction() as conn:
+            variable_id = self._variable_id(conn, session_id, var_type, var_name)
+            if variable_id is None:
+                return
+            updated = conn.execute(
+                "UPDATE terms SET name = ?, data = ? WHERE variable_id = ? AND name = ?",
+                (term.get("term_name"), json.dumps(term), variable_id, term_name)
+            ).rowcount
+            if updated:
+                self._bump(conn, session_id)
+
+    def delete_term(self, session_id, var_type, var_name, term_name):
+        self._ensure(session_id)
+        with self._transaction() as conn:
+            variable_id = self._variable_id(conn, session_id, var_type, var_name)
+            if variable_id is None:
+                return
+            deleted = conn.execute(
+                "DELETE FROM terms WHERE variable_id = ? AND name = ?", (variable_id, term_name)).rowcount
+            if deleted:
+                self._bump(conn, session_id)
+
+    def next_rule_id(self, session_id):
+        self._ensure(session_id)
+        row = self._connection().execute(
+            "SELECT rule_counter FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return f"Rule{row[0] if row else 0}"
+
+    def add_rule(self, session_id, rule_id, rule):
+        self._ensure(session_id)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM antecedents WHERE session_id = ? AND rule_id = ?", (session_id, rule_id))
+            conn.execute("DELETE FROM rules WHERE session_id = ? AND rule_id = ?", (session_id, rule_id))
+            self._insert_rule(conn, session_id, rule_id, rule)
+            self._bump(conn, session_id)
+            number = _rule_number(rule_id)
+            self._advance_counter(conn, session_id, number + 1 if number is not None else None)
+
+    def add_rules(self, session_id, rules):
+        self._ensure(session_id)
+        with self._transaction() as conn:
+            self._bump(conn, session_id)
+            first = conn.execute("SELECT rule_counter FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+            rule_ids = [f"Rule{first + k}" for k in range(len(rules))]
+            conn.executemany(
+                "INSERT INTO rules (session_id, rule_id, number, output_variable, output_term, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(session_id, rule_id, first + k, rule.get("output_variable"), rule.get("output_term"),
+                  json.dumps({key: value for key, value in rule.items() if key != "inputs"}))
+                 for k, (rule_id, rule) in enumerate(zip(rule_ids, rules))]
+            )
+            conn.executemany(
+                "INSERT INTO antecedents (session_id, rule_id, position, input_variable, input_term) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(session_id, rule_id, k, cond.get("input_variable"), cond.get("input_term"))
+                 for rule_id, rule in zip(rule_ids, rules) for k, cond in enumerate(rule.get("inputs") or [])]
+            )
+            self._advance_counter(conn, session_id, first + len(rules))
+        return rule_ids
+
+    def delete_rule(self, session_id, rule_id):
+        self._ensure(session_id)
+        with self._transaction() as conn:
+            deleted = conn.execute(
+                "DELETE FROM rules WHERE session_id = ? AND rule_id = ?", (session_id, rule_id)).rowcount
+            if not deleted:
+                return False
+            conn.execute("DELETE FROM antecedents WHERE session_id = ? AND rule_id = ?", (session_id, rule_id))
+            self._bump(conn, session_id)
+        return True
+
+
+class JournalStorage(JSONStorage):
+    """Snapshot JSON più un journal append-only delle modifiche granulari.
+
+    Ogni modifica di un termine o di una regola aggiunge una riga compatta a
+    session_<id>.journal ({"v": versione, "op": una delle MUTATIONS, "args": [...]}), quindi
+    il costo di scrittura è proporzionale alla modifica e non alla sessione. La lettura
+    riapplica allo snapshot (session_<id>.json, lo stesso file del backend JSON) le righe
+    del journal con versione successiva. Quando il journal supera compact_bytes un thread in
+    background lo ripiega in un nuovo snapshot, sotto il lock della sessione.
+
+    Le scritture vanno fatte tenendo il lock della sessione (lock_path), come per gli altri backend.
+    """
+
+    def __init__(self, base_dir, compact_bytes=JOURNAL_COMPACT_BYTES):
+        super().__init__(base_dir)
+        self.compact_bytes = int(compact_bytes)
+        self.pending = set()
+        self.queue = queue.Queue()
+        self.worker = None
+
+    def journal_path(self, session_id):
+        return os.path.join(self.base_dir, f"session_{session_id}.journal")
+
+    def _stat(self, file_path):
+        try:
+            return self._signature(file_path)
+        except FileNotFoundError:
+            return None
+
+    def load(self, session_id, readonly=False):
+        data = self._entry(session_id)["data"]
+        return data if readonly else _copy(data)
+
+    def _entry(self, session_id):
+        """Stato corrente della sessione: {"stat", "journal": (inode, offset applicato), "data"}."""
+        snapshot = self.path(session_id)
+        while True:
+            signature = self._stat(snapshot)
+            with self.lock:
+                entry = self.store.get(snapshot)
+            if entry is None or entry["stat"] != signature:
+                entry = self._read_snapshot(snapshot, signature)
+            entry = self._replay(entry, session_id)
+            # Snapshot sostituito durante la lettura (compattazione o salvataggio completo): si rilegge
+            if self._stat(snapshot) == signature:
+                break
+        with self.lock:
+            self.store[snapshot] = entry
+        return entry
+
+    def _read_snapshot(self, snapshot, signature):
+        data = {}
+        if signature is not None:
+            with open(snapshot, "r") as f:
+                data = json.load(f)
+        return {"stat": signature, "journal": None, "data": data}
+
+    def _replay(self, entry, session_id):
+        """Applica le righe complete del journal non ancora lette."""
+        journal = self.journal_path(session_id)
+        try:
+            st = os.stat(journal)
+        except FileNotFoundError:
+            return entry
+        inode, offset = entry.get("journal") or (st.st_ino, 0)
+        if inode != st.st_ino or st.st_size < offset:
+            # Journal ricreato: si riparte dallo snapshot
+            entry = self._read_snapshot(self.path(session_id), entry["stat"])
+            inode, offset = st.st_ino, 0
+        if st.st_size == offset:
+            return {**entry, "journal": (inode, offset)}
+
+        with open(journal, "rb") as f:
+            f.seek(offset)
+            chunk = f.read(st.st_size - offset)
+        # Un'eventuale ultima riga incompleta (scrittura interrotta) viene ignorata
+        end = chunk.rfind(b"\n") + 1
+        data = dict(entry["data"])
+        for line in chunk[:end].splitlines():
+            record = json.loads(line)
+            if record["v"] <= data.get(VERSION_KEY, 0):
+                continue  # già incluso nello snapshot
+            MUTATIONS[record["op"]](data, *record["args"])
+            data[VERSION_KEY] = record["v"]
+        return {**entry, "journal": (inode, offset + end), "data": data}
+
+    def _mutate(self, session_id, op, *args):
+        """Applica la modifica in memoria e la aggiunge al journal come una sola riga."""
+        entry = self._entry(session_id)
+        data = dict(entry["data"])
+        MUTATIONS[op](data, *args)
+        data[VERSION_KEY] = data.get(VERSION_KEY, 0) + 1
+        line = json.dumps({"v": data[VERSION_KEY], "op": op, "args": args}, separators=(",", ":")) + "\n"
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        journal = self.journal_path(session_id)
+        with open(journal, "ab") as f:
+            offset = (entry.get("journal") or (None, 0))[1]
+            if f.tell() != offset:
+                os.ftruncate(f.fileno(), offset)  # via una riga incompleta lasciata da una scrittura interrotta
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            journal_state = (os.fstat(f.fileno()).st_ino, f.tell())
+
+        with self.lock:
+            self.store[self.path(session_id)] = {**entry, "journal": journal_state, "data": data}
+        if journal_state[1] >= self.compact_bytes:
+            self._schedule(session_id)
+
+    def save(self, session_id, data):
+        """Salvataggio completo: nuovo snapshot e journal azzerato."""
+        super().save(session_id, data)
+        self._discard_journal(session_id)
+
+    def _discard_journal(self, session_id):
+        journal = self.journal_path(session_id)
+        if os.path.exists(journal):
+            os.remove(journal)
+        with self.lock:
+            entry = self.store.get(self.path(session_id))
+            if entry is not None:
+                self.store[self.path(session_id)] = {**entry, "journal": None}
+
+    # === Compattazione ===
+
+    def _schedule(self, session_id):
+        with self.lock:
+            if session_id in self.pending:
+                return
+            self.pending.add(session_id)
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._compact_loop, name="journal-compactor", daemon=True)
+                self.worker.start()
+        self.queue.put(session_id)
+
+    def _compact_loop(self):
+        while True:
+            session_id = self.queue.get()
+            try:
+                self.compact(session_id)
+            except Exception as e:
+                print(f"Error while compacting session {session_id}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(session_id)
+
+    def compact(self, session_id, force=False):
+        """Ripiega il journal in un nuovo snapshot (stessa versione); True se è stato compattato.
+
+        Senza force lo fa solo se il journal è ancora oltre la soglia (un altro processo
+        potrebbe averlo già compattato).
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+        with file_lock(lock_path(self.base_dir, session_id)):
+            journal = self.journal_path(session_id)
+            size = os.path.getsize(journal) if os.path.exists(journal) else 0
+            if size == 0 or (not force and size < self.compact_bytes):
+                return False
+            # Prima lo snapshot, poi la rimozione del journal: se il processo si interrompe in
+            # mezzo, le righe rimaste hanno versioni già incluse nello snapshot e vengono saltate
+            self._write(session_id, dict(self._entry(session_id)["data"]))
+            self._discard_journal(session_id)
+        return True
@@ -0,0 +1,24 @@
+import time
+
+from benchmark import synthetic_fis
+from flaskr import fis_model
+from flaskr.fis_model import FISModel, control_surface
+
+
+def test_large_rule_base_surface_stays_interactive():
+    # 4900 regole, 70 termini di output: la griglia 100x100 resta piena e in tempi interattivi
+    model = FISModel(synthetic_fis(2, 70))
+    start = time.perf_counter()
+    axes, _, z = control_surface(model, "x0", "x1", 100, 100)
+    elapsed = time.perf_counter() - start
+    assert len(axes["x0"]) == len(axes["x1"]) == 100
+    assert z["y"].shape == (100, 100)
+    assert elapsed < 10
+
+
+def test_surface_is_downsampled_over_budget(monkeypatch):
+    model = FISModel(synthetic_fis(2, 5))
+    monkeypatch.setattr(fis_model, "SURFACE_BUDGET", 50 * 40 * model.sample_cost())
+    axes, _, z = control_surface(model, "x0", "x1", 100, 80)
+    assert (len(axes["x0"]), len(axes["x1"])) == (50, 40)
+    assert z["y"].shape == (40, 50)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from flaskr.defuzzify import ExactCentroid, centroid_batch, output_method
+from flaskr.fis_model import output_curve
+
+
+def partition(n_terms, function_type="Triangolare"):
+    """n_terms termini equidistanti su [0, 100], come li crea la pagina di output."""
+    centers = np.linspace(0, 100, n_terms)
+    width = 100 / (n_terms - 1)
+    if function_type == "Gaussian":
+        return [{"term_name": f"o{j}", "function_type": "Gaussian", "params": {"mean": float(c), "sigma": width / 2}}
+                for j, c in enumerate(centers)]
+    return [{"term_name": f"o{j}", "function_type": "Triangolare",
+             "params": {"a": float(c - width), "b": float(c), "c": float(c + width)}}
+            for j, c in enumerate(centers)]
+
+
+def activations(n_samples, n_terms, seed=0):
+    w = np.random.default_rng(seed).uniform(0.0, 1.0, size=(n_samples, n_terms))
+    w[w < 0.6] = 0.0
+    return w
+
+
+def test_many_term_centroid_matches_fine_grid():
+    terms = partition(40)
+    centroid = ExactCentroid(terms, [0, 100], grid_points=1000)
+    assert centroid.supported
+
+    w = activations(300, len(terms))
+    x = np.linspace(0, 100, 50001)
+    y = np.array([output_curve("y", term, [0, 100], len(x)) for term in terms])
+    expected = centroid_batch(x, np.fmin(w[:, :, None], y[None, :, :]).max(axis=1))
+    np.testing.assert_allclose(centroid(w), expected, atol=1e-3)
+
+
+def test_linear_cost_grows_linearly_with_terms():
+    # Ogni termine incrocia solo i vicini: il lavoro per campione è proporzionale al numero di termini
+    for n in (10, 40, 160):
+        assert ExactCentroid(partition(n), [0, 100]).work_per_sample <= 40 * n
+    # 2000 campioni con 160 termini restano in poche decine di MB di temporanei
+    assert ExactCentroid(partition(160), [0, 100])(activations(2000, 160)).shape == (2000,)
+
+
+def test_expensive_gaussian_output_falls_back_to_grid():
+    assert ExactCentroid(partition(8, "Gaussian"), [0, 100], grid_points=1000).supported
+    assert not ExactCentroid(partition(40, "Gaussian"), [0, 100], grid_points=1000).supported
+    assert ExactCentroid(partition(40, "Gaussian"), [0, 100]).supported
+
+
+def test_output_method_is_shared_by_the_whole_variable():
+    assert output_method([{"term_name": "a"}, {"term_name": "b"}]) == "centroid"
+    assert output_method([{"term_name": "a"}, {"term_name": "b", "defuzzy_type": "MOM"}]) == "mom"
+    with pytest.raises(ValueError, match="disagree"):
+        output_method([{"defuzzy_type": "mom"}, {"defuzzy_type": "lom"}])
+    with pytest.raises(ValueError, match="Unknown"):
+        output_method([{"defuzzy_type": "median"}])
@@ -0,0 +1,46 @@
+import pytest
+from flask import Flask
+
+from flaskr import fis_model, routes
+from flaskr.file_handler import get_session_id, save_data
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fis_model, "MODEL_CACHE_SIZE", 2)
+    monkeypatch.setattr(fis_model, "_MODEL_CACHE", fis_model.OrderedDict())
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp, url_prefix="/api")
+    return app
+
+
+def session(app, user):
+    return app.test_request_context("/", headers={"Cookie": f"user_id={user}"},
+                                    environ_base={"REMOTE_ADDR": "127.0.0.1"})
+
+
+@pytest.fixture(autouse=True)
+def saved_sessions(app):
+    for user in ("a", "b", "c"):
+        with session(app, user):
+            save_data({"input": {}, "output": {}})
+
+
+def test_model_cache_is_bounded_lru(app):
+    sessions = {}
+    for user in ("a", "b", "a", "c"):
+        with session(app, user):
+            model = fis_model.get_model()
+            assert sessions.setdefault(user, model) is model
+            sessions[user + "_id"] = get_session_id()
+
+    assert list(fis_model._MODEL_CACHE) == [sessions["a_id"], sessions["c_id"]]
+
+
+def test_discard_model_evicts_the_session(app):
+    with session(app, "a"):
+        model = fis_model.get_model()
+        fis_model.discard_model(get_session_id())
+        assert get_session_id() not in fis_model._MODEL_CACHE
+        assert fis_model.get_model() is not model
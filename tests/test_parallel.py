@@ -0,0 +1,60 @@
+import multiprocessing
+import pickle
+
+import numpy as np
+import pytest
+
+from flaskr.fis_model import FISModel, batch_infer
+from flaskr import parallel
+
+
+def small_fis():
+    """FIS con due input e tre termini per variabile, tutte le combinazioni come regole."""
+    data = {"input": {}, "output": {}}
+    shapes = [
+        {"function_type": "Triangolare", "params": {"a": 0, "b": 0, "c": 50}},
+        {"function_type": "Gaussian", "params": {"mean": 50, "sigma": 15}},
+        {"function_type": "Trapezoidale", "params": {"a": 50, "b": 80, "c": 100, "d": 100}},
+    ]
+    for name in ("x1", "x2", "y"):
+        section = "output" if name == "y" else "input"
+        data[section][name] = {
+            "domain": [0, 100],
+            "terms": [{"term_name": f"t{j}", **shape} for j, shape in enumerate(shapes)]
+        }
+    for i in range(3):
+        for j in range(3):
+            data[f"Rule{3 * i + j}"] = {
+                "inputs": [{"input_variable": "x1", "input_term": f"t{i}"},
+                           {"input_variable": "x2", "input_term": f"t{j}"}],
+                "output_variable": "y",
+                "output_term": f"t{(i + j) % 3}"
+            }
+    return data
+
+
+@pytest.fixture
+def model():
+    yield FISModel(small_fis())
+    parallel.shutdown_pools()
+
+
+def test_model_is_picklable(model):
+    X = np.random.default_rng(0).uniform(0, 100, size=(50, 2))
+    restored = pickle.loads(pickle.dumps(model))
+    np.testing.assert_allclose(batch_infer(restored, X)["y"], batch_infer(model, X)["y"])
+
+
+def test_spawn_pool_matches_serial_and_is_reused(model):
+    X = np.random.default_rng(1).uniform(0, 100, size=(2000, 2))
+    context = multiprocessing.get_context("spawn")
+    expected = batch_infer(model, X)["y"]
+
+    result = parallel.parallel_batch_infer(model, X, workers=2, chunk_rows=300, mp_context=context)
+    np.testing.assert_allclose(result["y"], expected)
+    pools = [entry["pool"] for entry in parallel._POOLS.values()]
+    assert len(pools) == 1
+
+    again = parallel.parallel_batch_infer(model, X[:700], workers=2, chunk_rows=300, mp_context=context)
+    np.testing.assert_allclose(again["y"], expected[:700])
+    assert [entry["pool"] for entry in parallel._POOLS.values()] == pools
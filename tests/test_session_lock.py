@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from flaskr import routes
+from flaskr.file_handler import session_lock
+
+HEADERS = {"User-Agent": "lock-test"}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp, url_prefix="/api")
+    return app
+
+
+@pytest.fixture
+def held_lock(app):
+    """Tiene il lock della sessione di test in un altro thread finché il test non lo rilascia."""
+    acquired, release = threading.Event(), threading.Event()
+
+    def hold():
+        context = app.test_request_context("/", headers=HEADERS, environ_base={"REMOTE_ADDR": "127.0.0.1"})
+        with context, session_lock():
+            acquired.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    assert acquired.wait(5)
+    yield release
+    release.set()
+    thread.join()
+
+
+def request_in_thread(app, method, url, **kwargs):
+    result = {}
+
+    def run():
+        result["response"] = app.test_client().open(url, method=method, headers=HEADERS, **kwargs)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def test_reads_do_not_wait_for_the_session_lock(app, held_lock):
+    for method, url, body in [("GET", "/api/load", None), ("GET", "/api/get_rules", None),
+                              ("POST", "/api/infer_batch", {"inputs": []})]:
+        thread, result = request_in_thread(app, method, url, json=body)
+        thread.join(5)
+        assert not thread.is_alive(), url
+        assert "response" in result, url
+
+
+def test_mutations_wait_for_the_session_lock(app, held_lock):
+    thread, result = request_in_thread(app, "PUT", "/api/settings", json={"resolution": {"points": 500}})
+    thread.join(0.5)
+    assert thread.is_alive()
+
+    held_lock.set()
+    thread.join(5)
+    assert result["response"].status_code == 200
+
+
+def test_if_match_rejects_writes_based_on_a_stale_version(app):
+    client = app.test_client()
+    etag = client.get("/api/load", headers=HEADERS).headers["ETag"]
+    assert client.put("/api/settings", json={"resolution": {"points": 500}},
+                      headers={**HEADERS, "If-Match": etag}).status_code == 200
+
+    stale = client.put("/api/settings", json={"resolution": {"points": 800}}, headers={**HEADERS, "If-Match": etag})
+    assert stale.status_code == 412
+    assert client.get("/api/settings", headers=HEADERS).json["resolution"]["points"] == 500